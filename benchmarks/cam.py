@@ -0,0 +1,36 @@
+import numpy as np
+
+import xcesm  # noqa: F401, registers the accessors
+
+from .synthetic import cam_dataset
+
+
+class CAM(object):
+    params = [[12, 48], ['T42', 'f19']]
+    param_names = ['ntime', 'res']
+    timeout = 300
+
+    def setup(self, ntime, res):
+        self.ds = cam_dataset(ntime, res)
+        self.pres = self.ds.PS.utils.hybrid_to_pressure(source=self.ds)
+
+    def time_hybrid_to_pressure(self, ntime, res):
+        self.ds.PS.utils.hybrid_to_pressure(source=self.ds).compute()
+
+    def time_interp_to_pressure(self, ntime, res):
+        self.ds.T.utils.interp_to_pressure(self.pres, np.array([850., 500., 200.]) * 1e2).compute()
+
+    def time_mass_streamfun(self, ntime, res):
+        self.ds.V.utils.mass_streamfun().compute()
+
+    def time_zonalmean(self, ntime, res):
+        self.ds.T.utils.zonalmean().compute()
+
+    def time_precp(self, ntime, res):
+        self.ds.cam.precp().compute()
+
+    def peakmem_interp_to_pressure(self, ntime, res):
+        self.ds.T.utils.interp_to_pressure(self.pres, np.array([850., 500., 200.]) * 1e2).compute()
+
+    def peakmem_mass_streamfun(self, ntime, res):
+        self.ds.V.utils.mass_streamfun().compute()
@@ -0,0 +1,11 @@
+class Import(object):
+    timeout = 120
+
+    def timeraw_import_xcesm(self):
+        return 'import xcesm'
+
+    def timeraw_import_first_grid(self):
+        return '''
+        import xcesm.core.utils as utl
+        utl.grid('gx1v6').tarea
+        '''
@@ -0,0 +1,63 @@
+import xcesm  # noqa: F401, registers the accessors
+
+from .synthetic import pop_dataset
+
+
+class POP(object):
+    params = [[1, 4], ['gx3v7', 'gx1v6']]
+    param_names = ['ntime', 'grid']
+    timeout = 300
+
+    def setup(self, ntime, grid):
+        self.ds = pop_dataset(ntime, grid)
+        self.sst = self.ds.TEMP.isel(z_t=0)
+        # grid constants and operators are cached, build them outside the timing
+        self.sst.isel(time=0).utils.regrid()
+        self.sst.isel(time=0).utils.zonalmean()
+        self.ds.TEMP.isel(time=0).utils.gbvolmean(grid)
+
+    def time_regrid(self, ntime, grid):
+        self.sst.utils.regrid().compute()
+
+    def time_zonalmean(self, ntime, grid):
+        self.sst.utils.zonalmean().compute()
+
+    def time_gbvolmean(self, ntime, grid):
+        self.ds.TEMP.utils.gbvolmean(grid).compute()
+
+    def time_amoc(self, ntime, grid):
+        self.ds.pop.amoc(loc=True)[0].compute()
+
+    def time_amoc_windows(self, ntime, grid):
+        self.ds.pop.amoc(windows=[(500, [30, 80]), (1000, [20, 60]), (300, [40, 70])]).compute()
+
+    def time_basin_reduce(self, ntime, grid):
+        self.sst.utils.basin_reduce(grid=grid, how='wmean').compute()
+
+    def peakmem_gbvolmean(self, ntime, grid):
+        self.ds.TEMP.utils.gbvolmean(grid).compute()
+
+    def peakmem_regrid(self, ntime, grid):
+        self.sst.utils.regrid().compute()
+
+    def time_ocn_heat_transport(self, ntime, grid):
+        self.ds.pop.ocn_heat_transport(grid=grid).compute()
+
+    def time_ocn_heat_transport_basins(self, ntime, grid):
+        self.ds.SHF.utils.ocn_heat_transport(grid=grid, region=['Atlantic', 'Indo_Pacific']).compute()
+
+
+class POPStreamfun(object):
+    # the isothermal streamfunction uses the gx1v6 ANGLE and DZ
+    params = [[1, 2], [2., 1.]]
+    param_names = ['ntime', 'dlat']
+    timeout = 600
+
+    def setup(self, ntime, dlat):
+        self.ds = pop_dataset(ntime, 'gx1v6')
+
+    def time_mass_streamfun(self, ntime, dlat):
+        self.ds.pop.mass_streamfun(dlat=dlat, dlon=dlat).compute()
+
+    def peakmem_mass_streamfun(self, ntime, dlat):
+        self.ds.pop.mass_streamfun(dlat=dlat, dlon=dlat).compute()
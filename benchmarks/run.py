@@ -0,0 +1,150 @@
+'''
+Run the asv style benchmarks without asv and write the results as json.
+
+    python -m benchmarks.run -o results.json [-b regex] [-r repeat]
+
+time_* methods report the best wall time in seconds over repeat runs,
+peakmem_* the peak of memory traced by tracemalloc in bytes and timeraw_*
+the time of the returned code in a fresh interpreter, e.g. import time.
+Two result files can be compared with --compare old.json new.json.
+'''
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import textwrap
+import time
+import tracemalloc
+
+MODULES = ['imports', 'cam', 'pop', 'stat']
+KINDS = {'time': 's', 'peakmem': 'bytes', 'timeraw': 's'}
+
+
+def _benchmarks(pattern=None):
+    for mod in MODULES:
+        module = importlib.import_module('benchmarks.' + mod)
+        for cname, cls in sorted(vars(module).items()):
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            for attr in sorted(dir(cls)):
+                kind = attr.split('_')[0]
+                name = '{}.{}.{}'.format(mod, cname, attr)
+                if kind in KINDS and (pattern is None or re.search(pattern, name)):
+                    yield name, cls, attr, kind
+
+
+def _run_raw(code, repeat):
+    code = textwrap.dedent(code)
+    runner = ('import time; t = time.perf_counter(); exec(compile({!r}, "<bench>", "exec")); '
+              'print(time.perf_counter() - t)').format(code)
+    return [float(subprocess.check_output([sys.executable, '-c', runner]).decode().split()[-1])
+            for _ in range(repeat)]
+
+
+def _run(cls, attr, kind, params, repeat):
+    bench = cls()
+    if kind == 'timeraw':
+        return _run_raw(getattr(bench, attr)(*params), repeat)
+    if hasattr(bench, 'setup'):
+        bench.setup(*params)
+    method = getattr(bench, attr)
+    samples = []
+    try:
+        if kind == 'peakmem':
+            tracemalloc.start()
+            method(*params)
+            samples.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        else:
+            method(*params) # warm up
+            for _ in range(repeat):
+                t = time.perf_counter()
+                method(*params)
+                samples.append(time.perf_counter() - t)
+    finally:
+        if hasattr(bench, 'teardown'):
+            bench.teardown(*params)
+    return samples
+
+
+def _environment():
+    versions = {}
+    for pkg in ['numpy', 'scipy', 'xarray', 'dask', 'pyresample', 'matplotlib']:
+        try:
+            versions[pkg] = importlib.import_module(pkg).__version__
+        except ImportError:
+            versions[pkg] = None
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'machine': platform.machine(), 'system': platform.platform(),
+            'cpus': os.cpu_count(), 'versions': versions,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(pattern=None, repeat=3):
+    results = []
+    for name, cls, attr, kind in _benchmarks(pattern):
+        names = getattr(cls, 'param_names', [])
+        grid = getattr(cls, 'params', []) if kind != 'timeraw' else []
+        for params in (itertools.product(*grid) if grid else [()]):
+            samples = _run(cls, attr, kind, params, repeat)
+            results.append({'name': name, 'kind': kind, 'unit': KINDS[kind],
+                            'params': dict(zip(names, params)),
+                            'value': min(samples), 'samples': samples})
+            print('{:<45} {:<30} {:.4g} {}'.format(name, str(params), min(samples), KINDS[kind]),
+                  file=sys.stderr)
+    return {'environment': _environment(), 'results': results}
+
+
+def compare(old, new, factor=1.1):
+    '''
+    ratio new/old of every benchmark in both files, flagged above factor
+    '''
+    def key(r):
+        return r['name'], json.dumps(r['params'], sort_keys=True)
+    before = dict((key(r), r['value']) for r in old['results'])
+    rows = []
+    for r in new['results']:
+        if key(r) in before and before[key(r)] > 0:
+            ratio = r['value'] / before[key(r)]
+            rows.append({'name': r['name'], 'params': r['params'], 'ratio': ratio,
+                         'regression': ratio > factor})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-b', '--bench', default=None, help='regex on benchmark names')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', default=None, help='json file, stdout by default')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), default=None)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        out = compare(old, new)
+    else:
+        out = run(args.bench, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(out, f, indent=1)
+    else:
+        json.dump(out, sys.stdout, indent=1)
+    return out
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import xcesm  # noqa: F401, registers the accessors
+
+from .synthetic import series
+
+
+class Stat(object):
+    params = [[500, 2000]]
+    param_names = ['ntime']
+    timeout = 300
+
+    def setup(self, ntime):
+        self.x, self.y = series(ntime)
+
+    def time_stats_with(self, ntime):
+        self.x.stat.stats_with(self.y).compute()
+
+    def time_corr_with(self, ntime):
+        self.x.stat.corr_with(self.y).compute()
+
+    def time_regress_with(self, ntime):
+        self.x.stat.regress_with(self.y).compute()
+
+    def time_butter_filter(self, ntime):
+        self.x.stat.butter_filter(0.1, 1, 'low').compute()
+
+    def peakmem_stats_with(self, ntime):
+        self.x.stat.stats_with(self.y).compute()
+
+    def peakmem_corr_with(self, ntime):
+        self.x.stat.corr_with(self.y).compute()
@@ -0,0 +1,111 @@
+'''
+Synthetic CAM and POP datasets for the benchmarks, built offline from the
+grids bundled in xcesm/config. Values are random but shaped and named like
+CESM history output, fields are float32 and dask backed with one time step
+per chunk.
+'''
+import numpy as np
+import xarray as xr
+
+from xcesm.core import utils as utl
+
+# (nlat, nlon) of the supported resolutions
+CAM_GRIDS = {'T42': (64, 128), 'f19': (96, 144)}
+POP_GRIDS = {'gx3v7': 'g37', 'gx1v6': 'g16'}
+
+
+def _random(shape, seed=0, scale=1., offset=0.):
+    rng = np.random.default_rng(seed)
+    return (offset + scale * rng.standard_normal(shape)).astype('float32')
+
+
+def cam_dataset(ntime=12, res='T42', chunks={'time': 1}):
+    '''
+    CAM history like Dataset: V, T, Q on (time, lev, lat, lon), PS, PRECC and
+    PRECL on (time, lat, lon), with the CESM1 hybrid coefficients (30 levels).
+    '''
+    nlat, nlon = CAM_GRIDS[res]
+    hyam, hybm = utl.hybrid_coefs('CESM1', 'T42', 'm')
+    lev = hyam['lev'].values
+    nlev = len(lev)
+    lat = np.linspace(-90, 90, nlat)
+    lon = np.arange(nlon) * 360. / nlon
+
+    coords = {'time': np.arange(ntime, dtype=float), 'lev': lev, 'lat': lat, 'lon': lon}
+    d4 = ('time', 'lev', 'lat', 'lon')
+    d3 = ('time', 'lat', 'lon')
+    shape4 = (ntime, nlev, nlat, nlon)
+    shape3 = (ntime, nlat, nlon)
+    ds = xr.Dataset({'V': (d4, _random(shape4, 1, 5.)),
+                     'T': (d4, _random(shape4, 2, 10., 250.)),
+                     'Q': (d4, np.abs(_random(shape4, 3, 1e-3))),
+                     'PS': (d3, _random(shape3, 4, 1e3, 1e5)),
+                     'PRECC': (d3, np.abs(_random(shape3, 5, 1e-8))),
+                     'PRECL': (d3, np.abs(_random(shape3, 6, 1e-8))),
+                     'hyam': ('lev', hyam.values),
+                     'hybm': ('lev', hybm.values)},
+                    coords=coords)
+    return ds.chunk(chunks) if chunks else ds
+
+
+def pop_dataset(ntime=2, grid='gx1v6', chunks={'time': 1}):
+    '''
+    POP history like Dataset: TEMP, SALT, PA_P and TH_P (and UVEL, VVEL on
+    grids with ANGLE, i.e. gx1v6) on (time, z_t, nlat, nlon) masked below the
+    sea floor, SHF on (time, nlat, nlon) and MOC on (time, transport_reg,
+    moc_comp, moc_z, lat_aux_grid). z_t is in cm.
+    '''
+    g = utl.grid(POP_GRIDS[grid])
+    tarea = g.tarea
+    nlat, nlon = tarea.shape
+    dz = g.dz.values
+    z_t = g.dz['z_t'].values
+    ocean = (utl.volume_weights(grid) > 0).values
+    nz = len(z_t)
+
+    coords = {'time': np.arange(ntime, dtype=float), 'z_t': z_t,
+              'TLAT': (('nlat', 'nlon'), tarea.TLAT.values),
+              'TLONG': (('nlat', 'nlon'), tarea.TLONG.values)}
+    d4 = ('time', 'z_t', 'nlat', 'nlon')
+    shape4 = (ntime, nz, nlat, nlon)
+
+    def field(seed, scale, offset):
+        return np.where(ocean[None], _random(shape4, seed, scale, offset), np.nan).astype('float32')
+
+    # velocities on the U grid where the grid bundles ANGLE (and so ULAT/ULONG)
+    if 'angle' in g.fields:
+        angle = g.angle
+        coords['ULAT'] = (('nlat', 'nlon'), angle.ULAT.values)
+        coords['ULONG'] = (('nlat', 'nlon'), angle.ULONG.values)
+        velocity = {'UVEL': (d4, field(7, 10., 0.)), 'VVEL': (d4, field(8, 10., 0.))}
+    else:
+        velocity = {}
+
+    lat_aux = np.linspace(-79.5, 90, 395)
+    moc_z = np.concatenate([[0], np.cumsum(dz)])
+    ds = xr.Dataset({'TEMP': (d4, field(1, 5., 10.)),
+                     'SALT': (d4, field(2, 1., 35.)),
+                     'PA_P': (d4, np.abs(field(3, 1., 2.))),
+                     'TH_P': (d4, np.abs(field(4, 1., 20.))),
+                     'SHF': (('time', 'nlat', 'nlon'),
+                             np.where(ocean[0], _random((ntime, nlat, nlon), 5, 50.), np.nan)),
+                     'MOC': (('time', 'transport_reg', 'moc_comp', 'moc_z', 'lat_aux_grid'),
+                             _random((ntime, 2, 3, len(moc_z), len(lat_aux)), 6, 10.)),
+                     **velocity},
+                    coords=dict(coords, moc_z=moc_z, lat_aux_grid=lat_aux))
+    return ds.chunk(chunks) if chunks else ds
+
+
+def series(ntime=1000, nlat=64, nlon=128, chunks={'lat': 16}):
+    '''
+    a (time, lat, lon) field correlated with a red noise index on time
+    '''
+    rng = np.random.default_rng(0)
+    index = np.cumsum(rng.standard_normal(ntime)) * 0.1 + rng.standard_normal(ntime)
+    noise = rng.standard_normal((ntime, nlat, nlon))
+    coords = {'time': np.arange(ntime, dtype=float),
+              'lat': np.linspace(-90, 90, nlat), 'lon': np.arange(nlon) * 360. / nlon}
+    x = xr.DataArray(noise + 0.5 * index[:, None, None], dims=('time', 'lat', 'lon'),
+                     coords=coords, name='sst')
+    y = xr.DataArray(index, dims='time', coords={'time': coords['time']}, name='amoc')
+    return (x.chunk(chunks) if chunks else x), y
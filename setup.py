@@ -18,8 +18,8 @@ setup(name='xcesm',
       keywords='climate modeling modelling model gcm',
       license='MIT',
       # packages=['xcesm','config'],
-      packages=find_packages(),
+      packages=find_packages(exclude=['benchmarks']),
       package_data={'xcesm': ['config/*.nc', 'plots/*.json']},
       install_requires=['xarray', 'pyresample', 'cartopy'],
       zip_safe=False)
-print(find_packages())
+print(find_packages(exclude=['benchmarks']))
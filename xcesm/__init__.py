@@ -2,5 +2,5 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 from .core.xcesm import CAMDiagnosis, POPDiagnosis, Utilities
-from .core.utils import ocean_region, open_data, iTRACE, open_iTrace, open_iTrace_forcing
+from .core.utils import ocean_region, grid, open_data, iTRACE, open_iTrace, open_iTrace_forcing
 #from . import config
\ No newline at end of file
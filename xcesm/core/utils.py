@@ -1,4 +1,7 @@
 import os
+import warnings
+from collections import namedtuple, OrderedDict
+import numpy as np
 import xarray as xr
 
 # will append when needed
@@ -13,88 +16,192 @@ locations = {'Green_land': [72, 73, 321, 323],
             'Nino34': [-5,5,190,240]}
 
 
+# Pa/Th cores bundled in config/: name -> (constant, lat, lon, water depth in m)
+PATH_CORES = {'Bermuda': ('path', 33.7, -57.6, 4550),      # OCE326-GGC5
+              'MD95': ('path_MD95', 37.1, -32.0, 2630),    # MD95-2037
+              'SU81': ('path_SU81', 37.8, -10.2, 3135),    # SU81-18
+              'SU90': ('path_SU90', 50.0, -17.1, 4279)}    # SU90-44
+
 SETS = {'precp': ['PRECC', 'PRECL'],
         'd18op': ['PRECRC_H216Or', 'PRECSC_H216Os', 'PRECRL_H216OR', 'PRECSL_H216OS',
                   'PRECRC_H218Or', 'PRECSC_H218Os', 'PRECRL_H218OR', 'PRECSL_H218OS'],
         'dDp': ['PRECRC_H216Or', 'PRECSC_H216Os', 'PRECRL_H216OR', 'PRECSL_H216OS',
                   'PRECRC_HDOr', 'PRECSC_HDOs', 'PRECRL_HDOR', 'PRECSL_HDOS'],
         'd18ov': ['H216OV','H218OV'],
-        'moc': ['MOC']}
+        'flux': ['FLNT', 'FSNT', 'LHFLX', 'SHFLX', 'FSNS', 'FLNS', 'LANDFRAC', 'ICEFRAC'],
+        'flux-toa': ['FLNT', 'FSNT'],
+        'moc': ['MOC'],
+        'MOC': ['MOC'],
+        'ocn_heat': ['SHF', 'ADVT', 'ADVT_ISOP', 'ADVT_SUBM', 'HDIFT'],
+        'uvt': ['UVEL', 'VVEL', 'TEMP'],
+        'uivit': ['UISOP', 'VISOP', 'TEMP'],
+        'usvst': ['USUBM', 'VSUBM', 'TEMP'],
+        'uvt-total': ['USUBM', 'VSUBM', 'TEMP', 'UISOP', 'VISOP','VVEL', 'UVEL'],
+        'path': ['PA_P', 'TH_P']}
 
 COMP = {'precp': 'atm',
         'd18op': 'atm',
-        'moc': 'ocn'}
+        'dDp': 'atm',
+        'd18ov': 'atm',
+        'flux': 'atm',
+        'flux-toa': 'atm',
+        'moc': 'ocn',
+        'MOC': 'ocn',
+        'ocn_heat': 'ocn',
+        'uvt': 'ocn',
+        'uivit': 'ocn',
+        'usvst': 'ocn',
+        'uvt-total': 'ocn',
+        'path': 'ocn'}
+
 
+DATA_PATH = os.path.join(os.path.dirname(__file__), '../config/')
 
+# constant fields shipped in config/, name: (file name, open as dataset, postprocess)
+# nothing is read until a field is first accessed
+CONSTANTS = {'mask_g16': ('REGION_MASK_gx1v6.nc', False, None),
+             'mask_g35': ('REGION_MASK_gx3v5.nc', False, None),
+             'mask_g37': ('REGION_MASK_gx3v7.nc', False, None),
+             'tarea_g16': ('TAREA_gx1v6.nc', False, None),
+             'tarea_g35': ('TAREA_gx3v5.nc', False, None),
+             'tarea_g37': ('TAREA_gx3v7.nc', False, None),
+             'huw_g16': ('HUW_gx1v6.nc', False, None),
+             'hus_g16': ('HUS_gx1v6.nc', False, None),
+             'dxu_g16': ('DXU_gx1v6.nc', False, None),
+             'dyu_g16': ('DYU_gx1v6.nc', False, None),
+             'dxt_g16': ('DXT_gx1v6.nc', False, None),
+             'dyt_g16': ('DYT_gx1v6.nc', False, None),
+             'angle_g16': ('ANGLE_gx1v6.nc', False, None),
+             'angle_g35': ('ANGLE_gx3v5.nc', False, None),
+             'dz_g16': ('DZ_gx1v6.nc', False, None),
+             'dz_g35': ('DZ_gx3v5.nc', False, None),
+             'dz_g37': ('DZ_gx1v6.nc', False, None), # gx3v7 shares the 60 levels of gx1v6
+             'kmt_g16': ('KMT_gx1v6.nc', False, lambda x: x - 1), # land is -1, ocean starts from 0
+             'kmt_g35': ('KMT_gx3v5.nc', False, lambda x: x - 1),
+             'kmt_cube_g16': ('KMT_CUBE_gx1v6.nc', False, None), # 3-D mask for kmt
+             'kmt_cube_g35': ('KMT_CUBE_gx3v5.nc', False, None),
+             # CCSM4
+             'hyai_t42': ('hyai_t42.nc', False, None),
+             'hyam_t42': ('hyam_t42.nc', False, None),
+             'hybi_t42': ('hybi_t42.nc', False, None),
+             'hybm_t42': ('hybm_t42.nc', False, None),
+             # CESM1
+             'hyai_cesm1_t42': ('hyai_cesm1_t42.nc', False, None),
+             'hyam_cesm1_t42': ('hyam_cesm1_t42.nc', False, None),
+             'hybi_cesm1_t42': ('hybi_cesm1_t42.nc', False, None),
+             'hybm_cesm1_t42': ('hybm_cesm1_t42.nc', False, None),
+             'landfrac': ('cam_landfrac.nc', False, None),
+             # oxygen isotope data
+             'hulu': ('hulu_d18o.nc', False, None),
+             'hzz1': ('hzz1_d18o.nc', False, None),
+             'hzz2': ('hzz2_d18o.nc', False, None),
+             'sanbao': ('sanbao_d18o.nc', False, None),
+             'gisp2': ('gisp2_d18o.nc', False, None),
+             # Pa/Th data
+             'path': ('path_Bermuda.nc', False, None),
+             'path_MD95': ('path_MD95.nc', False, None),
+             'path_SU81': ('path_SU81.nc', False, None),
+             'path_SU90': ('path_SU90.nc', False, None),
+             # Dome C temp reconstruction
+             'domec': ('domeC_dD_temp.nc', True, None),
+             # sea level from melt water
+             'sea_level': ('sea_level_from_mwr.nc', False, None)}
 
+# pop grid names and the suffix used in CONSTANTS
+GRIDS = {'gx1v6': 'g16', 'gx3v5': 'g35', 'gx3v7': 'g37',
+         'g16': 'g16', 'g35': 'g35', 'g37': 'g37'}
 
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), '../config/')
-mask_g16 = xr.open_dataarray(DATA_PATH + 'REGION_MASK_gx1v6.nc')
-mask_g35 = xr.open_dataarray(DATA_PATH + 'REGION_MASK_gx3v5.nc')
-mask_g37 = xr.open_dataarray(DATA_PATH + 'REGION_MASK_gx3v7.nc')
-tarea_g16 = xr.open_dataarray(DATA_PATH + 'TAREA_gx1v6.nc')
-tarea_g35 = xr.open_dataarray(DATA_PATH + 'TAREA_gx3v5.nc')
-tarea_g37 = xr.open_dataarray(DATA_PATH + 'TAREA_gx3v7.nc')
-huw_g16 = xr.open_dataarray(DATA_PATH + 'HUW_gx1v6.nc')
-hus_g16 = xr.open_dataarray(DATA_PATH + 'HUS_gx1v6.nc')
-dxu_g16 = xr.open_dataarray(DATA_PATH + 'DXU_gx1v6.nc')
-dyu_g16 = xr.open_dataarray(DATA_PATH + 'DYU_gx1v6.nc')
-dxt_g16 = xr.open_dataarray(DATA_PATH + 'DXT_gx1v6.nc')
-dyt_g16 = xr.open_dataarray(DATA_PATH + 'DYT_gx1v6.nc')
-angle_g16 = xr.open_dataarray(DATA_PATH + 'ANGLE_gx1v6.nc')
-angle_g35 = xr.open_dataarray(DATA_PATH + 'ANGLE_gx3v5.nc')
-dz_g16 = xr.open_dataarray(DATA_PATH + 'DZ_gx1v6.nc')
-dz_g35 = xr.open_dataarray(DATA_PATH + 'DZ_gx3v5.nc')
-kmt_g16 = xr.open_dataarray(DATA_PATH + 'KMT_gx1v6.nc') - 1 # land is -1, ocean starts from 0
-kmt_cube_g16 = xr.open_dataarray(DATA_PATH + 'KMT_CUBE_gx1v6.nc') # 3-D mask for kmt
-kmt_cube_g35 = xr.open_dataarray(DATA_PATH + 'KMT_CUBE_gx3v5.nc') # 3-D mask for kmt
-
-# CCSM4
-hyai_t42 = xr.open_dataarray(DATA_PATH + 'hyai_t42.nc')
-hyam_t42 = xr.open_dataarray(DATA_PATH + 'hyam_t42.nc')
-hybi_t42 = xr.open_dataarray(DATA_PATH + 'hybi_t42.nc')
-hybm_t42 = xr.open_dataarray(DATA_PATH + 'hybm_t42.nc')
-
-# CESM1
-hyai_cesm1_t42 = xr.open_dataarray(DATA_PATH + 'hyai_cesm1_t42.nc')
-hyam_cesm1_t42 = xr.open_dataarray(DATA_PATH + 'hyam_cesm1_t42.nc')
-hybi_cesm1_t42 = xr.open_dataarray(DATA_PATH + 'hybi_cesm1_t42.nc')
-hybm_cesm1_t42 = xr.open_dataarray(DATA_PATH + 'hybm_cesm1_t42.nc')
-
-landfrac = xr.open_dataarray(DATA_PATH + 'cam_landfrac.nc')
-
-# oxygen isotope data
-hulu = xr.open_dataarray(DATA_PATH + 'hulu_d18o.nc')
-hzz1 = xr.open_dataarray(DATA_PATH + 'hzz1_d18o.nc')
-hzz2 = xr.open_dataarray(DATA_PATH + 'hzz2_d18o.nc')
-sanbao = xr.open_dataarray(DATA_PATH + 'sanbao_d18o.nc')
-gisp2 = xr.open_dataarray(DATA_PATH + 'gisp2_d18o.nc')
-
-# Pa/Th data
-path = xr.open_dataarray(DATA_PATH + 'path_Bermuda.nc')
-path_MD95 = xr.open_dataarray(DATA_PATH + 'path_MD95.nc')
-path_SU81 = xr.open_dataarray(DATA_PATH + 'path_SU81.nc')
-path_SU90 = xr.open_dataarray(DATA_PATH + 'path_SU90.nc')
-
-# Dome C temp reconstruction
-domec = xr.open_dataset(DATA_PATH + 'domeC_dD_temp.nc')
-
-# sea level from melt water 
-sea_level = xr.open_dataarray(DATA_PATH + 'sea_level_from_mwr.nc')
+class ConstantRegistry(object):
+    '''
+    Load constant fields from config/ on first access and keep them in memory.
+    The file is closed right after loading; use release() to drop the cache.
+    '''
+    def __init__(self, files, path=DATA_PATH):
+        self._files = files
+        self._path = path
+        self._cache = {}
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def __getitem__(self, name):
+        if name in self._cache:
+            return self._cache[name]
+
+        fname, is_dataset, post = self._files[name]
+        opener = xr.open_dataset if is_dataset else xr.open_dataarray
+        with opener(os.path.join(self._path, fname)) as ds:
+            data = ds.load()
+        if post is not None:
+            data = post(data)
+        self._cache[name] = data
+        return data
+
+    def loaded(self):
+        return list(self._cache.keys())
+
+    def release(self, name=None):
+        '''
+        drop cached fields, all of them if name is None
+        '''
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+
+constants = ConstantRegistry(CONSTANTS)
+
+
+class Grid(object):
+    '''
+    Constant fields of one pop grid, e.g. grid('gx1v6').tarea
+    '''
+    def __init__(self, name):
+        if name not in GRIDS:
+            raise ValueError('The gird is not supported.')
+        self.name = name
+        self.suffix = GRIDS[name]
+
+    @property
+    def fields(self):
+        end = '_' + self.suffix
+        return [k[:-len(end)] for k in CONSTANTS if k.endswith(end)]
+
+    def __getattr__(self, field):
+        key = field + '_' + self.suffix
+        if field.startswith('_') or key not in constants:
+            raise AttributeError('grid %s has no field %s' % (self.name, field))
+        return constants[key]
+
+    def release(self):
+        for f in self.fields:
+            constants.release(f + '_' + self.suffix)
+        _basin_cache.pop(self.suffix, None)
+        _volume_cache.pop(self.suffix, None)
+
+
+_grids = {}
+
+def grid(name='gx1v6'):
+    if name not in _grids:
+        _grids[name] = Grid(name)
+    return _grids[name]
+
+
+# keep the old module level names, e.g. utl.tarea_g16, loaded lazily
+def __getattr__(name):
+    if name in constants:
+        return constants[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 # ocean basin for pop output
-def ocean_region(grid='gx1v6'):
+BASINS = ['Atlantic', 'Pacific', 'Indo_Pacific', 'Arc_Atlantic', 'Pacific_LGM',
+          'SouthernOcn', 'North_Atlantic']
 
-    if grid == 'gx1v6':
-        rg = mask_g16
-    elif grid == 'gx3v7':
-        rg = mask_g37
-    elif grid == 'gx3v5':
-        rg = mask_g35
-    else: 
-        raise ValueError('The gird is not supported.')
+def _basin_regions(rg):
 
     regions = {'Atlantic': (rg==6) | ((rg==1)&((rg.TLONG>=300) | (rg.TLONG<=20))),
                'Pacific':  (rg==2) | ((rg==1)&((rg.TLONG>=150)& (rg.TLONG<=290))),
@@ -108,6 +215,1187 @@ def ocean_region(grid='gx1v6'):
     return regions
 
 
+_basin_cache = {}
+
+def basin_bits(grid='gx1v6'):
+    '''
+    all basins of a pop grid packed in one uint8 array, bit k is BASINS[k].
+    computed once per grid.
+    '''
+    g = Grid(grid)
+    if g.suffix not in _basin_cache:
+        rg = g.mask
+        regions = _basin_regions(rg)
+        bits = np.zeros(rg.shape, dtype=np.uint8)
+        for k, name in enumerate(BASINS):
+            bits |= regions[name].values.astype(np.uint8) << k
+        bits = rg.copy(data=bits).rename('basin_bits')
+        bits.attrs = {'basins': ', '.join(BASINS)}
+        _basin_cache[g.suffix] = bits
+    return _basin_cache[g.suffix]
+
+
+def basin_mask(grid='gx1v6', region='Atlantic'):
+    if region not in BASINS:
+        raise ValueError('region is not supported, use one of ' + ', '.join(BASINS))
+    mask = (basin_bits(grid) & (1 << BASINS.index(region))) > 0
+    return mask.rename(region)
+
+
+def ocean_region(grid='gx1v6'):
+    return dict((name, basin_mask(grid, name)) for name in BASINS)
+
+
+def basin_reduce(dsarray, grid='gx1v6', regions=None, how='mean', weights=None,
+                 dims=('nlat', 'nlon')):
+    '''
+    reduce dsarray over its horizontal dims (nlat, nlon by name) inside many
+    basins in one pass. how is 'sum', 'mean' or 'wmean' (weighted by weights,
+    TAREA by default). the horizontal dims are replaced by a 'basin' dim.
+    '''
+    if regions is None:
+        regions = BASINS
+    bits = basin_bits(grid).values.ravel()
+    masks = np.stack([(bits >> BASINS.index(r)) & 1 for r in regions]).astype(float)
+
+    if how == 'wmean':
+        if weights is None:
+            weights = Grid(grid).tarea
+        masks = masks * np.asarray(weights).ravel()
+    elif how not in ['sum', 'mean']:
+        raise ValueError('how should be one of sum, mean, wmean.')
+
+    def _reduce(x):
+        x = x.reshape(x.shape[:-2] + (-1,))
+        valid = np.isfinite(x)
+        total = np.where(valid, x, 0.).dot(masks.T)
+        if how == 'sum':
+            return total
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return total / valid.astype(float).dot(masks.T)
+
+    out = xr.apply_ufunc(_reduce, dsarray,
+                         input_core_dims=[list(dims)],
+                         output_core_dims=[['basin']],
+                         dask='parallelized', output_dtypes=[float],
+                         dask_gufunc_kwargs={'output_sizes': {'basin': len(regions)},
+                                             'allow_rechunk': True})
+    out['basin'] = list(regions)
+    out.name = dsarray.name
+    return out
+
+
+def _ocean_cube(g, nz):
+    # 3-D ocean mask from kmt_cube, then KMT, then REGION_MASK for full columns
+    try:
+        cube = g.kmt_cube
+        return (cube.notnull() & (cube != 0)).values
+    except (AttributeError, OSError):
+        pass
+    try:
+        return np.arange(nz)[:, None, None] <= g.kmt.values[None]
+    except (AttributeError, OSError):
+        return np.broadcast_to(g.mask.values > 0, (nz,) + g.mask.shape)
+
+
+_volume_cache = {}
+
+def volume_weights(grid='g16'):
+    '''
+    ocean cell volume (z_t, nlat, nlon) of a pop grid in cm3, zero on land and
+    below the sea floor. computed once per grid.
+    '''
+    g = Grid(grid)
+    if g.suffix not in _volume_cache:
+        dz = g.dz.values
+        ocean = _ocean_cube(g, len(dz))
+        vol = dz[:, None, None] * g.tarea.values[None] * ocean
+        _volume_cache[g.suffix] = xr.DataArray(vol, dims=['z_t', 'nlat', 'nlon'], name='volume')
+    return _volume_cache[g.suffix]
+
+
+def level_site_operator(lat, lon, z, nlev, sites, weights=None):
+    '''
+    sparse (n_sites, nz * n_cells) operator over flattened (z, lat, lon)
+    cells. sites are (lat, lon, depth) targets: a 1x1 degree box around
+    (lat, lon) at the level of z nearest to depth, among the levels above
+    the deepest sea floor in the box (nlev is the number of ocean levels of
+    every cell).
+    '''
+    from scipy import sparse
+
+    boxes = [[s[0] - 0.5, s[0] + 0.5, s[1] - 0.5, s[1] + 0.5] for s in sites]
+    op = site_operator(lat, lon, boxes, weights=weights)
+    nlev = np.asarray(nlev).ravel()
+    rows, cols, vals = [], [], []
+    for i, site in enumerate(sites):
+        cells = op.indices[op.indptr[i]:op.indptr[i + 1]]
+        top = int(nlev[cells].max()) if len(cells) else 0
+        if top == 0:
+            continue
+        k = int(np.abs(np.asarray(z[:top]) - site[2]).argmin())
+        rows.extend([i] * len(cells))
+        cols.extend(k * lat.size + cells)
+        vals.extend(op.data[op.indptr[i]:op.indptr[i + 1]])
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(len(sites), len(z) * lat.size))
+
+
+def isothermal_streamfun(work, temp, theta):
+    '''
+    transport below each isotherm, work and temp are (..., z, lat, lon) arrays,
+    theta is increasing. return (..., lat, theta), nan above the warmest water.
+    T is binned once per column and accumulated with a cumsum along theta.
+    '''
+    shape = temp.shape
+    nlat = shape[-2]
+    ntheta = len(theta)
+    # rows are (leading dims, lat), columns are all points at that lat
+    temp = np.moveaxis(temp.reshape((-1,) + shape[-3:]), 2, 1).reshape(-1, shape[-3] * shape[-1])
+    work = np.moveaxis(work.reshape((-1,) + shape[-3:]), 2, 1).reshape(temp.shape)
+    nrow = temp.shape[0]
+
+    valid = np.isfinite(temp)
+    weight = np.where(valid & np.isfinite(work), work, 0.)
+    # bin k holds theta[k-1] < T <= theta[k]; bin ntheta is warmer than all isotherms
+    ind = np.searchsorted(theta, np.where(valid, temp, np.inf), side='left')
+    ind = ind + np.arange(nrow)[:, None] * (ntheta + 1)
+    psi = np.bincount(ind[valid], weights=weight[valid], minlength=nrow * (ntheta + 1))
+    psi = psi.reshape(nrow, ntheta + 1)[:, :ntheta].cumsum(axis=1)
+
+    tmax = np.where(valid, temp, -np.inf).max(axis=1)
+    psi[theta[None, :] > tmax[:, None]] = np.nan
+    return psi.reshape(shape[:-3] + (nlat, ntheta))
+
+
+# bundled hybrid coefficients, (model, resolution) -> suffix in CONSTANTS
+HYBRID = {('CESM1', 'T42'): 'cesm1_t42',
+          ('CCSM4', 'T42'): 't42',
+          ('CCSM3', 'T42'): 't42'}
+
+_hybrid_cache = {}
+
+def hybrid_coefs(model='CESM1', res='T42', stride='m', source=None):
+    '''
+    hybrid A, B coefficients of a cam vertical grid as DataArrays along
+    'lev' (stride 'm') or 'ilev' (stride 'i'), cached per model, resolution
+    and stride. source is a history file Dataset carrying hyam/hybm or
+    hyai/hybi; it is used for resolutions without bundled coefficients.
+    '''
+    if stride not in ['m', 'i']:
+        raise ValueError("stride should be 'm' or 'i'.")
+    names = ('hya' + stride, 'hyb' + stride)
+    if source is not None and all(n in source.variables for n in names):
+        a, b = source[names[0]], source[names[1]]
+        if 'time' in a.dims:
+            a, b = a.isel(time=0), b.isel(time=0)
+        key = (model, res, stride, a.size, grid_key(a.values, b.values))
+    elif (model, res) in HYBRID:
+        key = (model, res, stride)
+        a = b = None
+    else:
+        raise ValueError('no hybrid coefficients for {} {}, pass the history '
+                         'file as source.'.format(model, res))
+
+    if key not in _hybrid_cache:
+        if a is None:
+            suffix = HYBRID[(model, res)]
+            a = constants[names[0] + '_' + suffix]
+            b = constants[names[1] + '_' + suffix]
+        dim = 'lev' if stride == 'm' else 'ilev'
+        _hybrid_cache[key] = tuple(xr.DataArray(np.asarray(c.values, dtype=float), dims=dim,
+                                                coords={dim: c[c.dims[0]].values}, name=c.name)
+                                   for c in (a, b))
+    return _hybrid_cache[key]
+
+def cumtrapz_along(data, coord, dim):
+    '''
+    cumulative trapezoid integral of data along dim starting from zero,
+    coord has dim too and may vary along the other dims (e.g. pressure).
+    built from shift and cumsum, so dask input stays lazy.
+    '''
+    inc = (data + data.shift({dim: 1})) / 2 * (coord - coord.shift({dim: 1}))
+    return inc.fillna(0).cumsum(dim).transpose(*data.dims, ...)
+
+def interp_columns(data, coord, levels, interpolation='lin'):
+    '''
+    interpolate every column of data to levels, data and coord have the
+    vertical axis last and coord increases along it. return (..., len(levels)).
+    for each level the bracketing pair coord[i-1] <= level <= coord[i] is
+    found for all columns at once, nan where there is none.
+    '''
+    data, coord = np.broadcast_arrays(data, coord)
+    nlev = coord.shape[-1]
+    levels = np.asarray(levels, dtype=float)
+
+    # number of model levels at or above each target level, i.e. a searchsorted per column
+    k = (coord[..., None, :] <= levels[:, None]).sum(axis=-1)
+    i = np.clip(k, 1, nlev - 1)
+
+    P_abv = np.take_along_axis(coord, i, axis=-1)
+    P_bel = np.take_along_axis(coord, i - 1, axis=-1)
+    A_abv = np.take_along_axis(data, i, axis=-1)
+    A_bel = np.take_along_axis(data, i - 1, axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if interpolation == 'log':
+            out = np.log(levels/P_bel)/np.log(P_abv/P_bel)*(A_abv - A_bel) + A_bel
+        elif interpolation == 'lin':
+            out = A_bel + (levels-P_bel)*(A_abv - A_bel)/(P_abv - P_bel)
+        else:
+            raise ValueError("Don't know how to interpolate '{}'".format(interpolation))
+
+    # out of bounds
+    out[~((P_bel <= levels) & (levels <= P_abv))] = np.nan
+    return out
+
+
+def _sum4(a, b, c, d):
+    # at least float32, so integer fields can hold the nan mask
+    total = np.add(a, b, dtype=np.result_type(a, b, c, d, np.float32))
+    total += c
+    total += d
+    return total
+
+
+def isotope_delta(*fields):
+    '''
+    delta (permil) from the four H216O and then the four heavy isotope
+    precipitation fields, tiny H216O (< 1e-50) is masked as nan.
+    '''
+    p16 = _sum4(*fields[:4])
+    p16[p16 < 1e-50] = np.nan
+    delta = _sum4(*fields[4:8])
+    delta /= p16
+    delta -= 1
+    delta *= 1000
+    return delta
+
+
+def isotope_deltas(*fields):
+    '''
+    d18O, dD and d-excess from the four H216O, four H218O and four HDO
+    precipitation fields in one pass, the H216O sum is built once.
+    '''
+    p16 = _sum4(*fields[:4])
+    p16[p16 < 1e-50] = np.nan
+    deltas = []
+    for heavy in [fields[4:8], fields[8:12]]:
+        delta = _sum4(*heavy)
+        delta /= p16
+        delta -= 1
+        delta *= 1000
+        deltas.append(delta)
+    d18o, dD = deltas
+    return d18o, dD, dD - 8 * d18o
+
+
+class LRUCache(object):
+    '''
+    small least recently used cache for derived grid operators
+    '''
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+def grid_key(*arrays):
+    '''
+    short hash of coordinate arrays, used to key cached grid operators
+    '''
+    import hashlib
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=float)
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()[:16]
+
+
+_regrid_cache = LRUCache(maxsize=8)
+
+def regrid_index(lon_curv, lat_curv, dlon=1, dlat=1, cache_dir=None):
+    '''
+    nearest neighbour index from a curvilinear grid to a dlat x dlon linear grid.
+    index points into the flattened source grid, -1 where nothing is in range.
+    kept in memory, and on disk under cache_dir or $XCESM_CACHE if set.
+    '''
+    lon = np.arange(-180.,179.01,dlon)
+    lat = np.arange(-90.,89.999,dlat)
+
+    key = 'regrid_%s_%g_%g' % (grid_key(lon_curv, lat_curv), dlat, dlon)
+    index = _regrid_cache.get(key)
+    if index is not None:
+        return lon, lat, index
+
+    if cache_dir is None:
+        cache_dir = os.environ.get('XCESM_CACHE')
+    fname = os.path.join(cache_dir, key + '.npy') if cache_dir else None
+
+    if fname is not None and os.path.exists(fname):
+        index = np.load(fname)
+    else:
+        index = _nearest_index(lon_curv, lat_curv, lon, lat, radius=1000000*np.sqrt(dlon**2))
+        if fname is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # other workers may read the shared cache, move the file in complete
+            tmp = fname + '.%d' % os.getpid()
+            with open(tmp, 'wb') as f:
+                np.save(f, index)
+            os.replace(tmp, fname)
+
+    _regrid_cache.put(key, index)
+    return lon, lat, index
+
+
+def _nearest_index(lon_curv, lat_curv, lon, lat, radius):
+    import pyresample
+
+    lon_curv = np.array(lon_curv, dtype=float)
+    lat_curv = np.array(lat_curv, dtype=float)
+    # set lon to -180 to 180
+    lon_curv[lon_curv>180] = lon_curv[lon_curv>180] - 360
+
+    lon_lin, lat_lin = np.meshgrid(lon,lat)
+    lon_lin = pyresample.utils.wrap_longitudes(lon_lin)
+    #define two grid systems
+    orig_def = pyresample.geometry.SwathDefinition(lons=lon_curv, lats=lat_curv)
+    targ_def = pyresample.geometry.SwathDefinition(lons=lon_lin, lats=lat_lin)
+    valid_in, valid_out, index_array, _ = pyresample.kd_tree.get_neighbour_info(
+        orig_def, targ_def, radius, neighbours=1)
+
+    # map back to the full source and target grids
+    source = np.flatnonzero(valid_in)
+    target = np.flatnonzero(valid_out)
+    found = index_array < len(source)
+    index = np.full(lon_lin.size, -1, dtype=np.int64)
+    index[target[found]] = source[index_array[found]]
+    return index
+
+
+def gather(data, index):
+    '''
+    pick data[..., index] along the last axis, nan where index is -1
+    '''
+    out = np.take(data, np.where(index < 0, 0, index), axis=-1)
+    if not np.issubdtype(out.dtype, np.floating):
+        out = out.astype(float)
+    out[..., index < 0] = np.nan
+    return out
+
+
+_zonal_cache = LRUCache(maxsize=8)
+
+def lat_bin_operator(lat, lat_bins, weights=None):
+    '''
+    sparse (n_bins, n_cells) matrix, row i holds the weights of the cells with
+    lat_bins[i] < lat <= lat_bins[i+1]. built once per grid and bins.
+    '''
+    from scipy import sparse
+
+    lat = np.asarray(lat, dtype=float).ravel()
+    lat_bins = np.asarray(lat_bins, dtype=float)
+    key = 'zonal_%s_%s' % (grid_key(lat, lat_bins),
+                           'ones' if weights is None else grid_key(weights))
+    op = _zonal_cache.get(key)
+    if op is None:
+        ind = np.digitize(lat, lat_bins, right=True) - 1
+        valid = (ind >= 0) & (ind < len(lat_bins) - 1) & np.isfinite(lat)
+        if weights is None:
+            w = np.ones(valid.sum())
+        else:
+            w = np.asarray(weights, dtype=float).ravel()[valid]
+        op = sparse.csr_matrix((w, (ind[valid], np.flatnonzero(valid))),
+                               shape=(len(lat_bins) - 1, lat.size))
+        _zonal_cache.put(key, op)
+    return op
+
+
+def sparse_reduce(dsarray, op, dims, out_dim, labels, how='mean'):
+    '''
+    apply a sparse (n_out, n_cells) operator over dims of dsarray: weighted sum,
+    or mean over the valid points. one matmul per chunk, dims become out_dim.
+    '''
+    if how not in ['sum', 'mean']:
+        raise ValueError('how should be sum or mean.')
+
+    def _reduce(x):
+        shape = x.shape[:-len(dims)]
+        x = x.reshape(-1, op.shape[1])
+        valid = np.isfinite(x)
+        total = op.dot(np.where(valid, x, 0.).T).T
+        if how == 'mean':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                total = total / op.dot(valid.T.astype(float)).T
+        else:
+            total[:, np.diff(op.indptr) == 0] = np.nan # no cell in bin
+        return total.reshape(shape + (len(labels),))
+
+    out = xr.apply_ufunc(_reduce, dsarray,
+                         input_core_dims=[list(dims)],
+                         output_core_dims=[[out_dim]],
+                         dask='parallelized', output_dtypes=[float],
+                         dask_gufunc_kwargs={'output_sizes': {out_dim: len(labels)},
+                                             'allow_rechunk': True})
+    out[out_dim] = labels
+    out.name = dsarray.name
+    return out
+
+
+def zonal_reduce(dsarray, lat, lat_bins, labels, how='mean', weights=None,
+                 dims=('nlat', 'nlon')):
+    '''
+    sum or (weighted) mean of dsarray in latitude bins over its horizontal
+    dims (the dims of lat), one sparse matmul per chunk. the horizontal dims
+    become 'lat'.
+    '''
+    op = lat_bin_operator(lat, lat_bins, weights=weights)
+    return sparse_reduce(dsarray, op, list(dims), 'lat', labels, how=how)
+
+
+_site_cache = LRUCache(maxsize=8)
+
+def site_operator(lat, lon, sites, weights=None):
+    '''
+    sparse (n_sites, n_cells) matrix picking the grid cells of each site.
+    a site is a box [lat0, lat1, lon0, lon1], cells strictly inside as in
+    selloc, or a point (lat, lon), the nearest cell. lat, lon are 2-D,
+    longitudes are compared in 0-360.
+    '''
+    from scipy import sparse
+
+    lat = np.asarray(lat, dtype=float).ravel()
+    lon = np.asarray(lon, dtype=float).ravel() % 360
+    key = 'site_%s_%s_%s' % (grid_key(lat, lon), str([list(s) for s in sites]),
+                             'ones' if weights is None else grid_key(weights))
+    op = _site_cache.get(key)
+    if op is not None:
+        return op
+
+    w = np.ones(lat.size) if weights is None else np.asarray(weights, dtype=float).ravel()
+    rows, cols = [], []
+    for i, site in enumerate(sites):
+        if len(site) == 4:
+            lon0, lon1 = site[2] % 360, site[3] % 360
+            if lon0 > lon1: # box across 0E
+                inlon = (lon > lon0) | (lon < lon1)
+            else:
+                inlon = (lon > lon0) & (lon < lon1)
+            ind = np.flatnonzero((lat > site[0]) & (lat < site[1]) & inlon)
+        elif len(site) == 2:
+            dlon = (lon - site[1] % 360 + 180) % 360 - 180
+            dist = (lat - site[0]) ** 2 + (dlon * np.cos(np.deg2rad(site[0]))) ** 2
+            ind = [np.nanargmin(dist)]
+        else:
+            raise ValueError('site should be [lat0, lat1, lon0, lon1] or (lat, lon).')
+        rows.extend([i] * len(ind))
+        cols.extend(ind)
+    rows = np.asarray(rows, dtype=int)
+    cols = np.asarray(cols, dtype=int)
+    op = sparse.csr_matrix((w[cols], (rows, cols)), shape=(len(sites), lat.size))
+    _site_cache.put(key, op)
+    return op
+
+
+# bundled proxy records: name -> (constant, variable of a Dataset, site,
+# quantity). site is a key of locations, 'global' for global mean records,
+# or None when the location has to be passed explicitly. only records of
+# the quantity of the model field are compared with it.
+PROXIES = {'hulu': ('hulu', None, 'Hulu', 'd18O'),
+           'hzz1': ('hzz1', None, None, 'd18O'),
+           'hzz2': ('hzz2', None, None, 'd18O'),
+           'sanbao': ('sanbao', None, 'Sanbao', 'd18O'),
+           'gisp2': ('gisp2', None, 'Green_land', 'd18O'),
+           'domec': ('domec', 'dDp', 'DomeC', 'dD'),
+           'sea_level': ('sea_level', None, 'global', 'sea_level')}
+
+# variable name prefixes (lower case) of model fields -> proxy quantity
+PROXY_QUANTITIES = [('d18o', 'd18O'), ('dd', 'dD'), ('sea_level', 'sea_level')]
+
+def proxy_quantity(name):
+    '''
+    proxy quantity of a model variable name, e.g. d18op -> d18O, None if unknown
+    '''
+    name = (name or '').lower()
+    for prefix, quantity in PROXY_QUANTITIES:
+        if name.startswith(prefix):
+            return quantity
+    return None
+
+
+def _bin_mean(values, ages, edges):
+    # mean of values in age bins, nan for empty bins
+    ind = np.digitize(ages, edges) - 1
+    ok = np.isfinite(values) & (ind >= 0) & (ind < len(edges) - 1)
+    total = np.bincount(ind[ok], weights=values[ok], minlength=len(edges) - 1)
+    count = np.bincount(ind[ok], minlength=len(edges) - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+
+class ProxyCatalog(object):
+    '''
+    Proxy records of config/ on a common, sorted age axis (ka, negative
+    before present, as in the bundled files). Records are loaded on first
+    use. compare samples a model field at every proxy site with one sparse
+    operator, puts it on the proxy ages and scores all proxies at once.
+    '''
+    def __init__(self, proxies=PROXIES):
+        self._proxies = proxies
+        self._records = {}
+
+    def names(self, located=False, quantity=None):
+        return [n for n, p in self._proxies.items()
+                if (p[2] is not None or not located) and (quantity is None or p[3] == quantity)]
+
+    def select(self, dsarray, names=None, sites=None, quantity=None):
+        '''
+        proxies to compare dsarray with: names if given, otherwise the
+        located records (or those in sites) of quantity, which defaults to
+        the quantity of the variable name (see proxy_quantity).
+        '''
+        if names is not None:
+            return list(names)
+        if quantity is None:
+            quantity = proxy_quantity(dsarray.name)
+        if quantity is None:
+            raise ValueError('cannot tell which proxies {} compares with, pass names '
+                             'or quantity.'.format(dsarray.name))
+        sites = {} if sites is None else sites
+        return [n for n in self.names(quantity=quantity)
+                if self.site(n) is not None or n in sites]
+
+    def record(self, name):
+        '''
+        proxy record sorted by age, repeated ages averaged
+        '''
+        if name not in self._records:
+            const, var = self._proxies[name][:2]
+            data = constants[const]
+            if var is not None:
+                data = data[var]
+            ages, inv = np.unique(data['time'].values, return_inverse=True)
+            values = (np.bincount(inv, weights=data.values) / np.bincount(inv))
+            self._records[name] = xr.DataArray(values, dims='age', coords={'age': ages}, name=name)
+        return self._records[name]
+
+    def site(self, name):
+        site = self._proxies[name][2]
+        return locations[site] if site in locations else site
+
+    def age_index(self, names=None):
+        '''
+        sorted union of the ages of names
+        '''
+        names = self.names() if names is None else names
+        return np.unique(np.concatenate([self.record(n).age.values for n in names]))
+
+    def table(self, names=None, bins=None):
+        '''
+        records of names as one (proxy, age) array, nan where a proxy has no
+        sample. bins are age bin edges to average the records in.
+        '''
+        names = self.names() if names is None else list(names)
+        if bins is not None:
+            bins = np.sort(np.asarray(bins, dtype=float))
+            ages = (bins[1:] + bins[:-1]) / 2
+            values = np.stack([_bin_mean(self.record(n).values, self.record(n).age.values, bins)
+                               for n in names])
+        else:
+            ages = self.age_index(names)
+            values = np.full((len(names), len(ages)), np.nan)
+            for i, n in enumerate(names):
+                values[i, np.searchsorted(ages, self.record(n).age.values)] = self.record(n).values
+        return xr.DataArray(values, dims=['proxy', 'age'],
+                            coords={'proxy': names, 'age': ages}, name='record')
+
+    def operator(self, lat, lon, names, sites=None, weights=None):
+        '''
+        sparse (n_proxy, n_cells) operator of the proxy sites, sites
+        overrides or completes the catalog locations.
+        '''
+        from scipy import sparse
+
+        sites = {} if sites is None else sites
+        rows = []
+        for n in names:
+            site = sites.get(n, self.site(n))
+            if site is None:
+                raise ValueError('no location for proxy {}, pass it in sites.'.format(n))
+            if site == 'global':
+                w = np.ones(np.size(lat)) if weights is None else np.asarray(weights, dtype=float).ravel()
+                rows.append(sparse.csr_matrix(w[None]))
+            else:
+                row = site_operator(lat, lon, [site], weights=weights)
+                if row.nnz == 0 and len(site) == 4:
+                    # box smaller than the grid cells, use the nearest cell
+                    warnings.warn('no cell inside the box of proxy {}, using the nearest '
+                                  'cell to its centre.'.format(n))
+                    centre = ((site[0] + site[1]) / 2., (site[2] + site[3]) / 2.)
+                    row = site_operator(lat, lon, [centre], weights=weights)
+                rows.append(row)
+        return sparse.vstack(rows).tocsr()
+
+    def sample(self, dsarray, lat, lon, names=None, sites=None, ages=None,
+               bins=None, weights=None, quantity=None):
+        '''
+        dsarray (time, lat/lon dims) at the proxy sites on the ages of table.
+        lat, lon are the cell centres, ages the model time in ka (time of
+        dsarray by default). proxies are chosen by select. returns (proxy, age).
+        '''
+        names = self.select(dsarray, names, sites, quantity)
+        op = self.operator(np.asarray(lat), np.asarray(lon), names, sites, weights)
+        series = sparse_reduce(dsarray, op, lat.dims, 'proxy', names).transpose('proxy', 'time')
+        series = np.asarray(series.values, dtype=float)
+
+        ages = np.asarray(dsarray['time'].values if ages is None else ages, dtype=float)
+        order = np.argsort(ages)
+        ages, series = ages[order], series[:, order]
+
+        obs = self.table(names, bins=bins)
+        if bins is not None:
+            values = np.stack([_bin_mean(s, ages, np.sort(np.asarray(bins, dtype=float)))
+                               for s in series])
+        else:
+            values = np.stack([np.interp(obs.age.values, ages, s, left=np.nan, right=np.nan)
+                               for s in series])
+        return xr.DataArray(values, dims=['proxy', 'age'], coords=obs.coords,
+                            name=dsarray.name)
+
+    def compare(self, dsarray, lat, lon, names=None, sites=None, ages=None,
+                bins=None, weights=None, quantity=None):
+        '''
+        model and proxy records on the proxy ages, with the correlation, root mean
+        square error and number of common samples of every proxy.
+        '''
+        names = self.select(dsarray, names, sites, quantity)
+        model = self.sample(dsarray, lat, lon, names, sites, ages, bins, weights)
+        obs = self.table(names, bins=bins)
+
+        m, o = model.values, obs.values
+        valid = np.isfinite(m) & np.isfinite(o)
+        n = valid.sum(-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dm = np.where(valid, m - np.nansum(np.where(valid, m, 0), -1, keepdims=True) / n[:, None], 0)
+            do = np.where(valid, o - np.nansum(np.where(valid, o, 0), -1, keepdims=True) / n[:, None], 0)
+            r = (dm * do).sum(-1) / np.sqrt((dm * dm).sum(-1) * (do * do).sum(-1))
+            rmse = np.sqrt(np.where(valid, (m - o) ** 2, 0).sum(-1) / n)
+
+        ds = xr.Dataset({'model': model, 'record': obs,
+                         'r': ('proxy', r), 'rmse': ('proxy', rmse), 'n': ('proxy', n)})
+        return ds
+
+
+proxies = ProxyCatalog()
+
+
+def heat_transport(flux, lat, area, dlat=1, method='Flux_adjusted', lat_bd=90, from_north=True):
+    '''
+    meridional heat transport (PW) implied by a surface heat flux (W/m2) on a
+    pop grid. flux is summed in latitude bins with an area weighted sparse
+    operator and integrated with a cumulative sum, so time and other leading
+    dims are kept and dask input stays lazy. the result has a 'lat' dim,
+    reversed when integrating from the north pole.
+    '''
+    lat_bins = np.arange(-90,91,dlat)
+    labels = np.arange(-89.5,90,dlat)
+    flux_lat = zonal_reduce(flux, lat, lat_bins, labels, how='sum',
+                            weights=np.asarray(area) * 1e-4) # convert to m2
+
+    if method == "Flux_adjusted":
+        flux_lat = flux_lat.where(flux_lat.lat < lat_bd) # north bound
+        flux_lat = flux_lat - flux_lat.mean('lat') # remove bias
+    elif method != "Flux":
+        raise ValueError("method is not suppoprted.")
+    flux_lat = flux_lat.fillna(0)
+
+    if from_north:
+        flux_lat = -flux_lat.isel(lat=slice(None, None, -1))
+
+    # trapezoid rule with unit spacing, zero at the first bin
+    integral = ((flux_lat + flux_lat.shift(lat=1)) / 2).fillna(0).cumsum('lat')
+    OHT = integral * 1e-15
+    OHT.name = flux.name
+    return OHT
+
+
+# streaming co-moments along the last axis, one record per time block:
+# count, means, centred second moments, co-moment, lag-1 pair sums and the
+# values at the block edges, so adjacent blocks can be merged exactly.
+_MOMENTS = ['n', 'mx', 'my', 'm2x', 'm2y', 'cxy',
+            'px', 'ax', 'bx', 'py', 'ay', 'by', 'np',
+            'fx', 'fy', 'lx', 'ly']
+_M = dict((name, i) for i, name in enumerate(_MOMENTS))
+
+# elements of x per block, i.e. the size of the work buffers
+MOMENT_BLOCK = 2 ** 20
+
+def _dot(a, b):
+    return np.einsum('...t,...t->...', a, b)
+
+def block_moments(x, y, x0=0., y0=0., lag=True, buffers=None):
+    '''
+    moments of one block of x - x0 and y - y0 along the last axis. returns an
+    array of shape (len(_MOMENTS), ..., 1); only steps where both x and y are
+    valid count. lag=False leaves the lag-1 sums at zero and the edge values
+    missing. buffers is an optional (x, y, valid) triple of work arrays at
+    least as long as the block along the last axis, reused between blocks.
+    '''
+    shape = np.broadcast_shapes(np.shape(x), np.shape(y))
+    if buffers is None:
+        buffers = np.empty(shape), np.empty(shape), np.empty(shape, dtype=bool)
+    nt = shape[-1]
+    xb, yb, valid = [b[..., :nt] for b in buffers]
+    np.subtract(x, x0, out=xb)
+    np.subtract(y, y0, out=yb)
+    np.isfinite(xb, out=valid)
+    valid &= np.isfinite(yb)
+    dense = valid.all()
+    if dense:
+        n = np.full(shape[:-1], float(nt))
+    else:
+        invalid = ~valid
+        np.copyto(xb, 0., where=invalid)
+        np.copyto(yb, 0., where=invalid)
+        n = valid.sum(-1).astype(float)
+
+    out = np.zeros((len(_MOMENTS),) + shape[:-1] + (1,))
+    m = out[..., 0]
+    m[_M['n']] = n
+    sx, sy = xb.sum(-1), yb.sum(-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m[_M['mx']] = np.where(n > 0, sx / n, 0.)
+        m[_M['my']] = np.where(n > 0, sy / n, 0.)
+
+    if lag:
+        # invalid steps are zero, so plain products only pick up valid pairs
+        for b, s, p, a, bb, f, l in [(xb, sx, 'px', 'ax', 'bx', 'fx', 'lx'),
+                                     (yb, sy, 'py', 'ay', 'by', 'fy', 'ly')]:
+            m[_M[p]] = _dot(b[..., :-1], b[..., 1:])
+            if dense:
+                m[_M[a]] = s - b[..., -1]
+                m[_M[bb]] = s - b[..., 0]
+            else:
+                m[_M[a]] = _dot(b[..., :-1], valid[..., 1:])
+                m[_M[bb]] = _dot(b[..., 1:], valid[..., :-1])
+            m[_M[f]] = np.where(valid[..., 0], b[..., 0], np.nan)
+            m[_M[l]] = np.where(valid[..., -1], b[..., -1], np.nan)
+        m[_M['np']] = nt - 1 if dense else (valid[..., :-1] & valid[..., 1:]).sum(-1)
+    else:
+        m[[_M[name] for name in ['fx', 'fy', 'lx', 'ly']]] = np.nan
+
+    xb -= m[_M['mx']][..., None]
+    yb -= m[_M['my']][..., None]
+    if not dense:
+        np.copyto(xb, 0., where=invalid)
+        np.copyto(yb, 0., where=invalid)
+    m[_M['m2x']] = _dot(xb, xb)
+    m[_M['m2y']] = _dot(yb, yb)
+    m[_M['cxy']] = _dot(xb, yb)
+    return out
+
+def blocked_moments(x, y, x0=0., y0=0., lag=True, size=None):
+    '''
+    moments of x and y along the last axis, computed over blocks of at most
+    size (MOMENT_BLOCK) elements that share one set of work buffers and are
+    merged in order. same output as block_moments.
+    '''
+    shape = np.broadcast_shapes(np.shape(x), np.shape(y))
+    cells = int(np.prod(shape[:-1]))
+    step = max(1, (size or MOMENT_BLOCK) // max(cells, 1))
+    step = min(step, shape[-1])
+    work = shape[:-1] + (step,)
+    buffers = np.empty(work), np.empty(work), np.empty(work, dtype=bool)
+    total = None
+    for start in range(0, shape[-1], step):
+        part = slice(start, start + step)
+        m = block_moments(x[..., part], y[..., part], x0, y0, lag, buffers)
+        total = m if total is None else merge_moments(total, m)
+    return total
+
+def merge_moments(a, b):
+    '''
+    merge the moments of two adjacent blocks, a before b (Chan et al.)
+    '''
+    out = np.empty(np.broadcast(a, b).shape)
+    na, nb = a[_M['n']], b[_M['n']]
+    n = na + nb
+    with np.errstate(invalid='ignore', divide='ignore'):
+        wb = np.where(n > 0, nb / n, 0.)
+        w = np.where(n > 0, na * nb / n, 0.)
+    dx = b[_M['mx']] - a[_M['mx']]
+    dy = b[_M['my']] - a[_M['my']]
+    out[_M['n']] = n
+    out[_M['mx']] = a[_M['mx']] + dx * wb
+    out[_M['my']] = a[_M['my']] + dy * wb
+    out[_M['m2x']] = a[_M['m2x']] + b[_M['m2x']] + dx * dx * w
+    out[_M['m2y']] = a[_M['m2y']] + b[_M['m2y']] + dy * dy * w
+    out[_M['cxy']] = a[_M['cxy']] + b[_M['cxy']] + dx * dy * w
+
+    # the pair straddling the block edge
+    edge = (np.isfinite(a[_M['lx']]) & np.isfinite(b[_M['fx']]))
+    lx, fx = np.where(edge, a[_M['lx']], 0.), np.where(edge, b[_M['fx']], 0.)
+    ly, fy = np.where(edge, a[_M['ly']], 0.), np.where(edge, b[_M['fy']], 0.)
+    for name, extra in [('px', lx * fx), ('ax', lx), ('bx', fx),
+                        ('py', ly * fy), ('ay', ly), ('by', fy), ('np', edge)]:
+        out[_M[name]] = a[_M[name]] + b[_M[name]] + extra
+    for name in ['fx', 'fy']:
+        out[_M[name]] = a[_M[name]]
+    for name in ['lx', 'ly']:
+        out[_M[name]] = b[_M[name]]
+    return out
+
+def fold_moments(moments):
+    '''
+    merge per block moments stacked along the last axis, in order
+    '''
+    total = moments[..., 0]
+    for i in range(1, moments.shape[-1]):
+        total = merge_moments(total, moments[..., i])
+    return total
+
+def moment_stats(m, stats=None):
+    '''
+    correlation, regression of x on y, covariance, effective sample size
+    (Bretherton et al. 1999, from the lag-1 autocorrelations) and two sided
+    p-value of the correlation from merged moments. stats is a subset of
+    STATS, in the order returned; neff and pvalue need the lag-1 sums.
+    '''
+    stats = STATS if stats is None else stats
+    n = m[_M['n']]
+    out = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'r' in stats or 'pvalue' in stats:
+            out['r'] = m[_M['cxy']] / np.sqrt(m[_M['m2x']] * m[_M['m2y']])
+        if 'slope' in stats:
+            out['slope'] = m[_M['cxy']] / m[_M['m2y']]
+        if 'cov' in stats:
+            out['cov'] = m[_M['cxy']] / n
+
+        if 'neff' in stats or 'pvalue' in stats:
+            rho = []
+            for v, p, a, b, m2 in [('mx', 'px', 'ax', 'bx', 'm2x'),
+                                   ('my', 'py', 'ay', 'by', 'm2y')]:
+                mean = m[_M[v]]
+                npair = m[_M['np']]
+                lag = m[_M[p]] - mean * (m[_M[a]] + m[_M[b]]) + npair * mean ** 2
+                rho.append(np.where(npair > 0, (lag / npair) / (m[_M[m2]] / n), 0.))
+            rr = np.clip(rho[0] * rho[1], -1 + 1e-12, 1 - 1e-12)
+            out['neff'] = np.clip(n * (1 - rr) / (1 + rr), 0, n)
+
+        if 'pvalue' in stats:
+            from scipy import stats as sps
+            dof = out['neff'] - 2
+            t = out['r'] * np.sqrt(dof / (1 - out['r'] ** 2))
+            out['pvalue'] = np.where(dof > 0, 2 * sps.t.sf(np.abs(t), np.maximum(dof, 1e-12)), np.nan)
+    return np.stack([out[name] for name in stats])
+
+STATS = ['r', 'slope', 'cov', 'pvalue', 'neff']
+
+def comoment_stats(x, y, dim='time', stats=None):
+    '''
+    correlation, regression, covariance, p-value and effective sample size
+    of x against y along dim in a single pass, or only the subset stats of
+    them. both fields are read block by block along dim and the per block
+    moments merged, dask input in parallel over its chunks; y is broadcast
+    against x per block, never in full. neff and pvalue need the lag-1 sums,
+    the other stats skip them. returns a Dataset.
+    '''
+    stats = STATS if stats is None else list(stats)
+    lag = 'neff' in stats or 'pvalue' in stats
+    x, y = xr.align(x, y, join='inner', copy=False)
+    dims = [d for d in x.dims if d != dim] + [d for d in y.dims if d not in x.dims and d != dim]
+
+    def arrange(a):
+        return a.expand_dims([d for d in dims if d not in a.dims]).transpose(*dims, dim).data
+
+    xd, yd = arrange(x), arrange(y)
+    if lag:
+        # shift by the first step to keep the raw lag sums well conditioned
+        x0, y0 = [np.nan_to_num(a[..., :1]) for a in (xd, yd)]
+    else:
+        x0 = y0 = 0.
+
+    if hasattr(xd, 'dask') or hasattr(yd, 'dask'):
+        import dask.array as da
+        xd, yd = da.asarray(xd), da.asarray(yd)
+        yd = yd.rechunk(tuple(cx if sx == sy else cy for cx, cy, sx, sy in
+                              zip(xd.chunks, yd.chunks, xd.shape, yd.shape)))
+        cells = tuple(cx if sx != 1 else cy for cx, cy, sx in
+                      zip(xd.chunks[:-1], yd.chunks[:-1], xd.shape[:-1]))
+        if lag:
+            x0, y0 = da.asarray(x0), da.asarray(y0)
+        chunks = ((len(_MOMENTS),),) + cells + ((1,) * len(xd.chunks[-1]),)
+        moments = da.map_blocks(blocked_moments, xd, yd, x0, y0, lag=lag, chunks=chunks,
+                                new_axis=0, dtype=float, meta=np.array((), dtype=float))
+        moments = moments.rechunk({moments.ndim - 1: -1})
+        result = da.map_blocks(lambda m: moment_stats(fold_moments(m), stats), moments,
+                               chunks=((len(stats),),) + cells,
+                               drop_axis=moments.ndim - 1, dtype=float,
+                               meta=np.array((), dtype=float))
+    else:
+        result = moment_stats(blocked_moments(xd, yd, x0, y0, lag)[..., 0], stats)
+
+    coords = dict((k, v) for a in (y, x) for k, v in a.coords.items() if dim not in v.dims)
+    out = xr.Dataset(coords=coords)
+    for i, name in enumerate(stats):
+        out[name] = (dims, result[i])
+    for name in ['r', 'pvalue']:
+        if name in out:
+            out[name].attrs['units'] = 'unitless'
+    if 'neff' in out:
+        out['neff'].attrs['long_name'] = 'effective sample size'
+    return out
+
+
+class DerivedCache(object):
+    '''
+    On-disk zarr cache of derived fields such as cam.d18op. Entries are keyed
+    on the variable, the time range and the dask tokens of the inputs, which
+    follow the source files and their mtimes. Least recently used entries are
+    evicted when the cache grows beyond max_size bytes.
+    '''
+    def __init__(self, path, max_size=10e9):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, name, inputs):
+        from dask.base import tokenize
+        parts = [name]
+        for da in inputs:
+            if 'time' in da.dims:
+                parts.append((str(da.time.values[0]), str(da.time.values[-1]), da.sizes['time']))
+            parts.append(da.encoding.get('source'))
+            parts.append(da.data)
+        return name + '-' + tokenize(*parts)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + '.zarr')
+
+    def get(self, key, name):
+        path = self._entry(key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path, None) # mark as recently used
+        return xr.open_zarr(path)[name]
+
+    def put(self, key, dsarray):
+        '''
+        write dsarray and return it read back from the cache. the cache is
+        opt-in, if the cache cannot be written (zarr missing, disk full,
+        no permission) a warning is issued and dsarray is returned as is.
+        '''
+        import shutil
+        path = self._entry(key)
+        tmp = path + '.%d.tmp' % os.getpid()
+        # zarr needs uniform chunks, open_mfdataset over files of different
+        # lengths gives uneven time chunks
+        if dsarray.chunks is None:
+            chunks = {'time': 100} if 'time' in dsarray.dims else {}
+        else:
+            chunks = dict((d, max(c)) for d, c in zip(dsarray.dims, dsarray.chunks))
+        uniform = dsarray.chunk(chunks)
+        uniform.encoding = {}
+        try:
+            uniform.to_dataset().to_zarr(tmp, mode='w')
+        except (OSError, ImportError) as err:
+            shutil.rmtree(tmp, ignore_errors=True)
+            warnings.warn('could not cache {} in {}: {}'.format(dsarray.name, self.path, err))
+            return dsarray
+        if os.path.isdir(path):
+            shutil.rmtree(tmp)
+        else:
+            os.rename(tmp, path)
+        self.evict(keep=path)
+        return self.get(key, dsarray.name)
+
+    def entries(self):
+        '''
+        (last access, size in bytes, path) of every entry, oldest first
+        '''
+        result = []
+        for f in os.listdir(self.path):
+            if not f.endswith('.zarr'):
+                continue
+            path = os.path.join(self.path, f)
+            size = 0
+            for root, _, files in os.walk(path):
+                size += sum(os.path.getsize(os.path.join(root, n)) for n in files)
+            result.append((os.stat(path).st_mtime, size, path))
+        return sorted(result)
+
+    def evict(self, keep=None):
+        import shutil
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def invalidate(self, name=None):
+        '''
+        remove the entries of a variable, or everything if name is None
+        '''
+        import shutil
+        for _, _, path in self.entries():
+            if name is None or os.path.basename(path).startswith(name + '-'):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+derived_cache = None
+
+def enable_derived_cache(path=None, max_size=10e9):
+    '''
+    opt in to caching derived fields on disk, under path or $XCESM_CACHE/derived
+    '''
+    global derived_cache
+    if path is None:
+        if not os.environ.get('XCESM_CACHE'):
+            raise ValueError('set XCESM_CACHE or give a path for the cache.')
+        path = os.path.join(os.environ['XCESM_CACHE'], 'derived')
+    derived_cache = DerivedCache(path, max_size=max_size)
+    return derived_cache
+
+
+def disable_derived_cache():
+    global derived_cache
+    derived_cache = None
+
+
+def _time_summary(fname):
+    with xr.open_dataset(fname, decode_times=False) as ds:
+        t = ds['time'].values
+    return float(t[0]), bool(np.all(np.diff(t) > 0))
+
+
+def build_index(files, fname):
+    '''
+    combined index of files ordered by time, written to fname as json.
+    with kerchunk installed and increasing time in every file it holds the
+    references to all chunks, so later opens read only the index. otherwise
+    it keeps the time sorted file list.
+    '''
+    import json
+    summary = [_time_summary(f) for f in files]
+    order = sorted(range(len(files)), key=lambda i: summary[i][0])
+    index = dict(files=[files[i] for i in order],
+                 sort=not all(s[1] for s in summary))
+
+    if not index['sort']:
+        try:
+            import fsspec
+            from kerchunk.hdf import SingleHdf5ToZarr
+            from kerchunk.combine import MultiZarrToZarr
+        except ImportError:
+            pass
+        else:
+            try:
+                refs = [_references(f) for f in index['files']]
+                with xr.open_dataset(index['files'][0], decode_times=False) as ds:
+                    identical = [k for k, v in ds.variables.items() if 'time' not in v.dims]
+                index['refs'] = MultiZarrToZarr(refs, concat_dims=['time'],
+                                                identical_dims=identical).translate()
+            except Exception:
+                pass # keep the sorted file list
+
+    cache_dir = os.path.dirname(fname)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = fname + '.%d' % os.getpid()
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, fname)
+    return index
+
+
+def _references(fname):
+    # kerchunk references of a netcdf4 (hdf5) or classic netcdf3 file
+    import fsspec
+    with open(fname, 'rb') as f:
+        classic = f.read(3) == b'CDF'
+    if classic:
+        from kerchunk.netCDF3 import NetCDF3ToZarr
+        return NetCDF3ToZarr(fname).translate()
+    from kerchunk.hdf import SingleHdf5ToZarr
+    with fsspec.open(fname, 'rb') as inf:
+        return SingleHdf5ToZarr(inf, fname).translate()
+
+
+def open_index(files, cache_dir=None, rebuild=False, variables=None, **kwargs):
+    '''
+    open files through their combined index, the index is keyed on the file
+    names, mtimes and sizes and built once under cache_dir or $XCESM_CACHE.
+    variables: keep only these and their coordinates, see projection
+    '''
+    import json
+    import hashlib
+    if cache_dir is None:
+        cache_dir = os.environ.get('XCESM_CACHE')
+    if not cache_dir:
+        raise ValueError('set XCESM_CACHE or give cache_dir to keep the index.')
+
+    # rewritten or extended files change the key, stale references are not reused
+    stamps = []
+    for f in sorted(files):
+        st = os.stat(f)
+        stamps.append('%s %r %d' % (f, st.st_mtime, st.st_size))
+    key = hashlib.sha1('\n'.join(stamps).encode()).hexdigest()[:16]
+    fname = os.path.join(cache_dir, 'index_%s.json' % key)
+    if rebuild or not os.path.exists(fname):
+        index = build_index(files, fname)
+    else:
+        with open(fname, 'r') as f:
+            index = json.load(f)
+
+    if 'refs' in index:
+        kwargs.setdefault('chunks', {})
+        ds = xr.open_dataset('reference://', engine='zarr',
+                             backend_kwargs=dict(consolidated=False,
+                                                 storage_options=dict(fo=index['refs'])),
+                             **kwargs)
+        if variables is not None:
+            ds = projection(variables)['preprocess'](ds)
+    elif variables is not None:
+        ds = xr.open_mfdataset(index['files'], **dict(projection(variables), **kwargs))
+    else:
+        ds = xr.open_mfdataset(index['files'], **kwargs)
+    if index['sort']:
+        ds = ds.sortby('time')
+    return ds
+
+
+def projection(variables):
+    '''
+    open_mfdataset options that keep only variables and the coordinates they
+    use, and skip comparing coordinates across files
+    '''
+    def _select(ds):
+        return ds[[v for v in variables if v in ds.data_vars]]
+
+    return dict(preprocess=_select, data_vars='minimal', coords='minimal', compat='override')
+
+
 def open_data(var, project_name='iTRACE', **kwargs):
     return iTRACE(var, project_name).open_data(**kwargs)
 
@@ -125,6 +1413,146 @@ class open_iTrace_forcing:
         self.solin_djf = xr.open_mfdataset(os.path.join(self.DATA_PATH, 'forcing/*.SOLIN.*.DJF.nc'))
         self.ghgs = xr.open_mfdataset(os.path.join(self.DATA_PATH, 'forcing/iTRACE_ghgs.nc'), decode_times=False)
 
+# experiment of iTRACE history files, matched on the file name
+EXPERIMENTS = [('ice', ['itrace.03', 'ice.']),
+               ('ico', ['ice_orb.', 'ico.']),
+               ('igo', ['ice_ghg_orb.', 'igo.']),
+               ('igom', ['ice_ghg_orb_mwtr.', 'igom.'])]
+
+
+def parse_history_name(fname):
+    '''
+    split a CESM history file name into (experiments, variable, chunk),
+    e.g. case.ico.20ka.pop.h.TEMP.0001-0099.ANN.nc gives
+    (['ico'], 'TEMP', '0001-0099'). variable and chunk are None if not found.
+    '''
+    import re
+    experiments = [e for e, keys in EXPERIMENTS if any(k in fname for k in keys)]
+    tokens = fname.split('.')
+    variable = None
+    for i, t in enumerate(tokens[:-1]):
+        if re.match(r'^h\d*[a-z]*$', t):
+            variable = tokens[i+1]
+            break
+    chunks = [t for t in tokens if re.match(r'^\d+(-\d+)?$', t)]
+    chunk = chunks[-1] if chunks else None
+    return experiments, variable, chunk
+
+
+HistoryFile = namedtuple('HistoryFile', ['path', 'experiments', 'variable', 'chunk'])
+
+
+class FileCatalog(object):
+    '''
+    In-memory index of the history files in DATA_PATH/{atm,ocn}/ANN.
+    File names are parsed once, a directory is listed again only when its
+    mtime changes. The index is also saved as json under cache_dir or
+    $XCESM_CACHE if set, so new processes do not list the archive again.
+    '''
+    COMPONENTS = ['atm', 'ocn']
+
+    def __init__(self, data_path, cache_dir=None):
+        self.data_path = data_path
+        if cache_dir is None:
+            cache_dir = os.environ.get('XCESM_CACHE')
+        self.fname = None
+        if cache_dir:
+            import hashlib
+            key = hashlib.sha1(os.path.abspath(data_path).encode()).hexdigest()[:16]
+            self.fname = os.path.join(cache_dir, 'catalog_%s.json' % key)
+        self._dirs = {}
+        self._tokens = {}
+        self._load()
+
+    def _dir(self, component):
+        return os.path.join(self.data_path, component, 'ANN')
+
+    def _load(self):
+        import json
+        if self.fname is None or not os.path.exists(self.fname):
+            return
+        try:
+            with open(self.fname, 'r') as f:
+                self._dirs = json.load(f)
+        except ValueError:
+            self._dirs = {}
+
+    def _save(self):
+        import json
+        if self.fname is None:
+            return
+        cache_dir = os.path.dirname(self.fname)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = self.fname + '.%d' % os.getpid()
+        with open(tmp, 'w') as f:
+            json.dump(self._dirs, f)
+        os.replace(tmp, self.fname)
+
+    def _stale(self, component):
+        path = self._dir(component)
+        if not os.path.isdir(path):
+            return False
+        entry = self._dirs.get(component)
+        return entry is None or entry['mtime'] != os.stat(path).st_mtime
+
+    def _scan(self, component):
+        path = self._dir(component)
+        mtime = os.stat(path).st_mtime
+        files = []
+        for f in os.scandir(path):
+            if f.name.endswith('.nc'):
+                files.append([f.name] + list(parse_history_name(f.name)))
+        return component, dict(mtime=mtime, files=files)
+
+    def refresh(self, components=None):
+        '''
+        list again the directories whose mtime changed, in parallel
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        if components is None:
+            components = self.COMPONENTS
+        stale = [c for c in components if self._stale(c)]
+        if not stale:
+            return
+        with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            for component, entry in pool.map(self._scan, stale):
+                self._dirs[component] = entry
+                self._tokens.pop(component, None)
+        self._save()
+
+    def files(self, component):
+        '''
+        all entries [name, experiments, variable, chunk] of a component
+        '''
+        self.refresh([component])
+        return self._dirs.get(component, dict(files=[]))['files']
+
+    def lookup(self, component, var):
+        '''
+        HistoryFile entries of the files with var as a dot separated token in
+        their name, same match as glob('*.' + var + '.*.nc')
+        '''
+        files = self.files(component)
+        if component not in self._tokens:
+            tokens = {}
+            for i, f in enumerate(files):
+                for t in set(f[0].split('.')[1:-1]):
+                    tokens.setdefault(t, []).append(i)
+            self._tokens[component] = tokens
+        ind = self._tokens[component].get(var, [])
+        path = self._dir(component)
+        return sorted(HistoryFile(os.path.join(path, files[i][0]), *files[i][1:]) for i in ind)
+
+
+_catalogs = {}
+
+def file_catalog(data_path, cache_dir=None):
+    key = (os.path.abspath(data_path), cache_dir)
+    if key not in _catalogs:
+        _catalogs[key] = FileCatalog(data_path, cache_dir=cache_dir)
+    return _catalogs[key]
+
+
 # ITRACE: data path for iTRACE
 class iTRACE:
     def __init__(self, var, project_name='iTRACE'):
@@ -153,35 +1581,32 @@ class iTRACE:
         return result
             
     def get_path(self):
-        import glob
         varlist, component = self.get_varlist()
+        # file names are listed and parsed once, see FileCatalog
+        catalog = file_catalog(self.DATA_PATH)
         fl = []
         for v in varlist:
-            if component == 'atm':
-                path = os.path.join(self.DATA_PATH, 'atm/ANN')      
-            elif component == 'ocn':
-                path = os.path.join(self.DATA_PATH, 'ocn/ANN')
-            else:
-                pass
-            temp = glob.glob(path + '/*.' + v + '.*.nc')
-            fl.append(temp)
-
-        fl = self._extend(fl)
-        # get subsets 
-        ico = [f for f in fl if 'ice_orb.' in f or 'ico.' in f]
-        ice = [f for f in fl if 'itrace.03' in f or 'ice.' in f]
-        igo = [f for f in fl if 'ice_ghg_orb.' in f or 'igo.' in f]
-        igom = [f for f in fl if 'ice_ghg_orb_mwtr.' in f or 'igom.' in f]
+            fl.extend(catalog.lookup(component, v))
+
+        # get subsets
+        ico = [f.path for f in fl if 'ico' in f.experiments]
+        ice = [f.path for f in fl if 'ice' in f.experiments]
+        igo = [f for f in fl if 'igo' in f.experiments]
+        igom = [f.path for f in fl if 'igom' in f.experiments]
         if component == 'atm':
-            igofl = [f for f in igo if '.20ka.' in f and '0999' in f]
-            igofl.sort()
-            igom = igofl + igom
+            markers = ['0999']
         elif component == 'ocn':
-            igofl = [f for f in igo if '.20ka.' in f and ('0099' in f or '0199' in f or '0299' in f or '0399' in f or '0499' in f or '0599' in f or '0599' in f or '0699' in f or '0799' in f or '0899' in f or '0999' in f)]
-            igofl.sort()
-            igom = igofl + igom
+            markers = ['0099', '0199', '0299', '0399', '0499', '0599', '0699', '0799', '0899', '0999']
         else:
+            markers = []
             Warning("20ka to 19ka all forcing run data has not been loaded!")
+        igofl = [f.path for f in igo if '.20ka.' in os.path.basename(f.path)
+                 and f.chunk is not None and any(m in f.chunk for m in markers)]
+        igofl.sort()
+        igom = igofl + igom
+        igo = [f.path for f in igo]
+        fl = [f.path for f in fl]
+
         # check for iTRACE, other dataset would take effect
         if ico and ice and igo: # need to add igom later
             fl = dict(ice=ice, ico=ico, igo=igo, igom=igom)
@@ -190,79 +1615,53 @@ class iTRACE:
         else:
             return fl
 
-            
+
     def get_varlist(self):
 
-        # if self.var in SETS.keys():
-        #     varlist = SETS[self.var]
-        #     component = COMP[self.var]
-        # else:
-        #     pass
+        if isinstance(self.var, list):
+            raise ValueError('Var set is not supported yet.')
 
-        if self.var == 'precp':
-            varlist = ['PRECC', 'PRECL']
-            component = 'atm'
-        elif self.var == 'd18op':
-            varlist = ['PRECRC_H216Or', 'PRECSC_H216Os', 'PRECRL_H216OR', 'PRECSL_H216OS',
-                       'PRECRC_H218Or', 'PRECSC_H218Os', 'PRECRL_H218OR', 'PRECSL_H218OS']
-            component = 'atm'
-        elif self.var == 'dDp':
-            varlist = ['PRECRC_H216Or', 'PRECSC_H216Os', 'PRECRL_H216OR', 'PRECSL_H216OS',
-                       'PRECRC_HDOr', 'PRECSC_HDOs', 'PRECRL_HDOR', 'PRECSL_HDOS']
-            component = 'atm'
-        elif self.var == 'd18ov':
-            varlist = ['H216OV','H218OV']
-            component = 'atm'
-        elif self.var == 'flux':
-            varlist = ['FLNT', 'FSNT', 'LHFLX', 'SHFLX', 'FSNS', 'FLNS', 'LANDFRAC', 'ICEFRAC']
-            component = 'atm'
-        elif self.var == 'flux-toa':
-            varlist = ['FLNT', 'FSNT']
-            component = 'atm'
-        elif self.var == 'MOC':
-            varlist = ['MOC']
-            component = 'ocn'
-        elif self.var == 'ocn_heat':
-            varlist = ['SHF', 'ADVT', 'ADVT_ISOP', 'ADVT_SUBM', 'HDIFT']
-            component = 'ocn'
-        elif self.var == 'uvt':
-            varlist = ['UVEL', 'VVEL', 'TEMP']
-            component = 'ocn'
-        elif self.var == 'uivit':
-            varlist = ['UISOP', 'VISOP', 'TEMP']
-            component = 'ocn'
-        elif self.var == 'usvst':
-            varlist = ['USUBM', 'VSUBM', 'TEMP']
-            component = 'ocn'
-        elif self.var == 'uvt-total':
-            varlist = ['USUBM', 'VSUBM', 'TEMP', 'UISOP', 'VISOP','VVEL', 'UVEL']
-            component = 'ocn'
-        elif self.var == 'path':
-            varlist = ['PA_P', 'TH_P']
-            component = 'ocn'
+        if self.var in SETS:
+            varlist = list(SETS[self.var])
+            component = COMP[self.var]
         else:
-            if len(self.var) > 1 and isinstance(self.var, list):
-                raise ValueError('Var set is not supported yet.')
-            else:
-                varlist = self.var.split()
-                component = 'atm'
-                if self.var in self.OCN_VAR: # modify it later
-                    component = 'ocn'
-                           
+            varlist = self.var.split()
+            component = 'atm'
+            if self.var in self.OCN_VAR: # modify it later
+                component = 'ocn'
+
         return varlist, component
-        
-    
-    def open_data(self, **kwargs):
-        
+
+    def _open(self, files, use_index=False, cache_dir=None, project=False, **kwargs):
+        variables = self.get_varlist()[0] if project else None
+        if use_index:
+            return open_index(files, cache_dir=cache_dir, variables=variables, **kwargs)
+        if variables is not None:
+            return xr.open_mfdataset(files, **dict(projection(variables), **kwargs)).sortby('time')
+        if len(files) > 1:
+            return xr.open_mfdataset(files, **kwargs).sortby('time')
+        else:
+            return xr.open_dataset(files[0], **kwargs).sortby('time')
+
+    def open_data(self, use_index=False, concurrent=False, cache_dir=None, project=False, **kwargs):
+        '''
+        use_index: open through a pre-sorted combined index, built on first use
+                   and kept under cache_dir or $XCESM_CACHE, see open_index
+        concurrent: open ice, ico, igo and igom in parallel threads
+        project: keep only the variables of the set (SETS) and their coordinates,
+                 coordinates are not compared across files
+        '''
         data = self.get_path()
+        opts = dict(kwargs, use_index=use_index, cache_dir=cache_dir, project=project)
         if self.iTRACE_flag:
-            ico = xr.open_mfdataset(data['ico'], **kwargs).sortby('time')
-            ice = xr.open_mfdataset(data['ice'], **kwargs).sortby('time')
-            igo = xr.open_mfdataset(data['igo'], **kwargs).sortby('time')
-            igom = xr.open_mfdataset(data['igom'], **kwargs).sortby('time')
+            exps = ['ice', 'ico', 'igo', 'igom']
+            if concurrent:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=len(exps)) as pool:
+                    futures = [pool.submit(self._open, data[e], **opts) for e in exps]
+                    ice, ico, igo, igom = [f.result() for f in futures]
+            else:
+                ice, ico, igo, igom = [self._open(data[e], **opts) for e in exps]
             return ice, ico, igo, igom
         else:
-            if len(data) > 1:
-                return xr.open_mfdataset(data, **kwargs).sortby('time')
-            else:
-                return xr.open_dataset(data[0], **kwargs).sortby('time')
+            return self._open(data, **opts)
@@ -21,8 +21,22 @@ class CAMDiagnosis(object):
         self._obj = xarray_obj
 
 
+    def _cached(self, name, inputs, compute):
+        # serve derived fields from utl.derived_cache when it is enabled
+        cache = utl.derived_cache
+        if cache is None or not all(v in self._obj for v in inputs):
+            return compute()
+        key = cache.key(name, [self._obj[v] for v in inputs])
+        result = cache.get(key, name)
+        if result is None:
+            result = cache.put(key, compute())
+        return result
+
     # precipation
     def precp(self):
+        return self._cached('precp', utl.SETS['precp'], self._precp)
+
+    def _precp(self):
         try:
             precc = self._obj.PRECC
             precl = self._obj.PRECL
@@ -44,20 +58,35 @@ class CAMDiagnosis(object):
         '''
         compute d18O precp
         '''
-        try:
-            p16 = self._obj.PRECRC_H216Or + self._obj.PRECSC_H216Os + \
-            self._obj.PRECRL_H216OR + self._obj.PRECSL_H216OS
+        return self._cached('d18Op', utl.SETS['d18op'], self._d18op)
 
-            p18 = self._obj.PRECRC_H218Or + self._obj.PRECSC_H218Os + \
-            self._obj.PRECRL_H218OR + self._obj.PRECSL_H218OS
-
-#            p16.values[p16.values < 1e-50] = np.nan
-            d18op = (p18 / p16 - 1)*1000
-            d18op.name = 'd18Op'
-        except:
+    def _d18op(self):
+        try:
+            fields = [self._obj[v] for v in utl.SETS['d18op']]
+        except KeyError:
             raise ValueError('object has no PRECRC_H216Or.')
+        dtype = np.result_type(*[f.dtype for f in fields], np.float32)
+        d18op = xr.apply_ufunc(utl.isotope_delta, *fields,
+                               dask='parallelized', output_dtypes=[dtype])
+        d18op.name = 'd18Op'
         return d18op
 
+    @property
+    def isotopes(self):
+        '''
+        d18Op, dDp and d-excess (dxs) computed together in one pass
+        '''
+        try:
+            fields = [self._obj[v] for v in utl.SETS['d18op'] + utl.SETS['dDp'][4:]]
+        except KeyError:
+            raise ValueError('object has no PRECRC_H216Or.')
+        dtype = np.result_type(*[f.dtype for f in fields], np.float32)
+        d18op, dDp, dxs = xr.apply_ufunc(utl.isotope_deltas, *fields,
+                                         output_core_dims=[[], [], []],
+                                         dask='parallelized', output_dtypes=[dtype] * 3)
+        dxs.attrs['Description'] = 'deuterium excess, dD - 8 * d18O'
+        return xr.Dataset(dict(d18Op=d18op, dDp=dDp, dxs=dxs))
+
     # d18ov
     @property
     def d18ov(self):
@@ -80,58 +109,49 @@ class CAMDiagnosis(object):
     @property
     def dDp(self):
         '''
-        compute d18O precp
+        compute dD precp
         '''
-        try:
-            p16 = self._obj.PRECRC_H216Or + self._obj.PRECSC_H216Os + \
-            self._obj.PRECRL_H216OR + self._obj.PRECSL_H216OS
-
-            pD = self._obj.PRECRC_HDOr + self._obj.PRECSC_HDOs + \
-            self._obj.PRECRL_HDOR + self._obj.PRECSL_HDOS
+        return self._cached('dDp', utl.SETS['dDp'], self._dDp)
 
-            p16.values[p16.values < 1e-50] = np.nan
-            dDp = (pD / p16 - 1)*1000
-            dDp.name = 'dDp'
-        except:
+    def _dDp(self):
+        try:
+            fields = [self._obj[v] for v in utl.SETS['dDp']]
+        except KeyError:
             raise ValueError('object has no PRECRC_H216Or.')
+        dtype = np.result_type(*[f.dtype for f in fields], np.float32)
+        dDp = xr.apply_ufunc(utl.isotope_delta, *fields,
+                             dask='parallelized', output_dtypes=[dtype])
+        dDp.name = 'dDp'
         return dDp
 
     def compute_heat_transport(self, dsarray, method):
-
-        from scipy import integrate
         '''
         compute heat transport using surface(toa,sfc) flux
+        integrated along lat lazily, other dims such as time are kept.
         '''
+        if 'lat' not in dsarray.dims:
+            raise ValueError('No lat coordinate!')
+
         lat_rad = np.deg2rad(dsarray.lat)
         coslat = np.cos(lat_rad)
         field = coslat * dsarray
 
-        if method is "Flux_adjusted":
+        if method == "Flux_adjusted":
             field = field - field.mean("lat")
             print("The heat transport is computed by Flux adjestment.")
-        elif method is "Flux":
+        elif method == "Flux":
             print("The heat transport is computed by Flux.")
-        elif method is "Dynamic":
+        elif method == "Dynamic":
             print("The heat transport is computed by dynamic method.")
             raise ValueError("Dynamic method has not been implimented.")
         else:
             raise ValueError("Method is not supported.")
 
+        integral = field.assign_coords(lat=lat_rad.values).cumulative_integrate('lat')
+        integral = integral.assign_coords(lat=dsarray.lat)
 
-        try:
-            latax = field.get_axis_num('lat')
-        except:
-            raise ValueError('No lat coordinate!')
-
-        integral = integrate.cumtrapz(field, x=lat_rad, initial=0., axis=latax)
-
-
-        transport = 1e-15 * 2 * np.math.pi * integral * cc.rearth **2  # unit in PW
-
-        if isinstance(field, xr.DataArray):
-            result = field.copy()
-            result.values = transport
-        return result.T
+        transport = 1e-15 * 2 * np.pi * integral * cc.rearth **2  # unit in PW
+        return transport.transpose(*dsarray.dims)
 
     # heat transport
 #    @property
@@ -139,43 +159,33 @@ class CAMDiagnosis(object):
 
         '''
         compute heat transport using surface(toa,sfc) flux
+        PHT, AHT and OHT come from one integral over both fluxes, time is kept.
         '''
 
         OLR = self._obj.FLNT.mean('lon')
         ASR = self._obj.FSNT.mean('lon')
         Rtoa = ASR - OLR  # net downwelling radiation
 
-        try:
-            # this block use atm flux to infer ocean heat trnasport but, use ocn output shall be more accurate
-            # make sea mask from landfrac and icefrac
-            lnd = self._obj.LANDFRAC
-            ice = self._obj.ICEFRAC
-            mask = 1- (lnd + ice) * 0.5
-            LHF = self._obj.LHFLX * mask
-            LHF = LHF.mean('lon')
-            SHF = self._obj.SHFLX * mask
-            SHF = SHF.mean('lon')
-
-            LWsfc = self._obj.FLNS * mask
-            LWsfc = LWsfc.mean('lon')
-            SWsfc = -self._obj.FSNS * mask
-            SWsfc = SWsfc.mean('lon')
-
-            SurfaceRadiation = LWsfc + SWsfc  # net upward radiation from surface
-        #        SurfaceHeatFlux = SurfaceRadiation + LHF + SHF + SnowFlux  # net upward surface heat flux
-            SurfaceHeatFlux = SurfaceRadiation + LHF + SHF  # net upward surface heat flux
-            Fatmin = Rtoa + SurfaceHeatFlux  # net heat flux in to atmosphere
-
-            AHT = self.compute_heat_transport(Fatmin, method)
-            PHT = self.compute_heat_transport(Rtoa, method)
-            OHT = PHT - AHT
-        except:
+        if not all(v in self._obj for v in ['LANDFRAC', 'ICEFRAC', 'LHFLX', 'SHFLX', 'FLNS', 'FSNS']):
             PHT = self.compute_heat_transport(Rtoa, method)
-            AHT = None
-            OHT = None
+            return PHT, None, None
+
+        # this block use atm flux to infer ocean heat trnasport but, use ocn output shall be more accurate
+        # make sea mask from landfrac and icefrac
+        lnd = self._obj.LANDFRAC
+        ice = self._obj.ICEFRAC
+        mask = 1- (lnd + ice) * 0.5
+        # net upward surface heat flux: radiation + latent + sensible
+        SurfaceHeatFlux = ((self._obj.FLNS - self._obj.FSNS + self._obj.LHFLX +
+                            self._obj.SHFLX) * mask).mean('lon')
+        Fatmin = Rtoa + SurfaceHeatFlux  # net heat flux in to atmosphere
+
+        flux = xr.concat([Rtoa, Fatmin], dim='flux')
+        HT = self.compute_heat_transport(flux, method)
+        PHT = HT.isel(flux=0, drop=True)
+        AHT = HT.isel(flux=1, drop=True)
+        OHT = PHT - AHT
 
-
-#        return PHT, AHT, OHT
         return PHT, AHT, OHT
 
 
@@ -222,85 +232,118 @@ class POPDiagnosis(object):
         self._obj = xarray_obj
 
     # PA/TH
-    def comp_path(self):
-        kmt = xcesm.core.utils.kmt_cube_g16
-        pa = self._obj.PA_P * kmt
-        pa = pa.sum('z_t')
-
-        th = self._obj.TH_P * kmt
-        th = th.sum('z_t')
-        path = pa / th
-        path = path * tarea
-        path = path.groupby('time').sum() / tarea.utils.North_Atlantic().sum()
-        return path.load()
+    def comp_path(self, grid='gx1v6', region='North_Atlantic'):
+        '''
+        Pa/Th of the water column (ocean levels only), area weighted over a
+        basin. lazy, keeps time.
+        '''
+        ocean = utl.volume_weights(grid) > 0
+        pa = self._obj.PA_P.where(ocean).sum('z_t')
+        th = self._obj.TH_P.where(ocean).sum('z_t')
+        path = (pa / th.where(th != 0)).transpose(..., 'nlat', 'nlon') # land columns sum to 0
+        path = utl.basin_reduce(path, grid, [region], how='wmean').isel(basin=0, drop=True)
+        path.name = 'path'
+        return path
 
 
     # PA/TH local
-    def pa_th(self, lat, lon, depth):
-        
-        dsarray = self._obj
-        
-        if lon < 0:
-            lon = lon + 360   # west hemisphere is negative 
+    def pa_th(self, lat, lon, depth, grid='gx1v6'):
+        '''
+        Pa/Th at (lat, lon, depth in m), see pa_th_sites
+        '''
+        return self.pa_th_sites({'site': (lat, lon, depth)}, grid=grid).isel(site=0, drop=True)
 
-        area = (dsarray.TLAT>lat-0.5) & (dsarray.TLAT<lat+0.5) \
-                & (dsarray.TLONG>lon-0.5) & (dsarray.TLONG<lon+0.5)
-        
-        pa = dsarray.PA_P.where(area, drop=True)
-        th = dsarray.TH_P.where(area, drop=True)
+    def pa_th_sites(self, sites=None, grid='gx1v6'):
+        '''
+        Pa/Th at many sites in one pass, returns (site, time).
+        sites: dict of name: (lat, lon, depth in m), the bundled cores in
+               utl.PATH_CORES by default. Each site is the mean over a 1x1
+               degree box at the model level nearest to depth.
+        '''
+        dsarray = self._obj
+        if sites is None:
+            sites = dict((k, v[1:]) for k, v in utl.PATH_CORES.items())
+        names = list(sites.keys())
 
-        pa = pa.mean('nlon').mean('nlat').dropna('z_t').load()
-        th = th.mean('nlon').mean('nlat').dropna('z_t').load()
+        z = dsarray.z_t.values
+        scale = 1e2 if z[-1] > 1e5 else 1. # z_t in cm or m
+        targets = [(sites[n][0], sites[n][1], sites[n][2] * scale) for n in names]
+        nlev = (utl.volume_weights(grid) > 0).sum('z_t').values
+        op = utl.level_site_operator(dsarray.TLAT.values, dsarray.TLONG.values, z, nlev, targets)
 
-        if dsarray.z_t[-1] > 1e5:
-            pa = pa.sel(z_t=depth * 1e2, method='nearest')
-            th = th.sel(z_t=depth * 1e2, method='nearest')
-        else:
-            pa = pa.sel(z_t=depth, method='nearest')
-            th = th.sel(z_t=depth, method='nearest')
-        path = pa / th
-        return path.load()
+        dims = ['z_t', 'nlat', 'nlon']
+        pa = utl.sparse_reduce(dsarray.PA_P.transpose(..., *dims), op, dims, 'site', names)
+        th = utl.sparse_reduce(dsarray.TH_P.transpose(..., *dims), op, dims, 'site', names)
+        path = (pa / th).transpose('site', ...)
+        path.name = 'path'
+        return path
 
 
     # amoc
-    def amoc(self, method='index', depth=500, lats=[30,80]):
+    def amoc(self, method='index', depth=500, lats=[30,80], windows=None, loc=False):
+        '''
+        method='index': max of the atlantic moc below depth (m) and between lats,
+        reduced lazily over depth and latitude in one call, time is kept.
+        windows: list of (depth, lats), all computed in one pass along a 'window' dim.
+        loc: also return the depth and latitude of the maximum.
+        '''
         if method == 'index':
-            try:
-                if 'MOC' in list(self._obj.keys()):
-                    moc = self._obj.MOC.isel(transport_reg=1,moc_comp=0).copy()
-                    moc.values[np.abs(moc.values) < 1e-6] = np.nan
-                    # amoc area
-                    if moc.moc_z[-1] > 1e5:
-                        z_bound = moc.moc_z[(moc.moc_z > depth * 1e2) & (moc.moc_z < 5e5)] #cm
-                    else:
-                        z_bound = moc.moc_z[(moc.moc_z > depth) & (moc.moc_z < 5e3)] #m
-                    lat_bound = moc.lat_aux_grid[
-                                (moc.lat_aux_grid > lats[0]) & (moc.lat_aux_grid < lats[1])]
-                    if "time" in moc.dims:
-                        amoc = moc.sel(moc_z=z_bound, lat_aux_grid=lat_bound).groupby('time').max()
-                    else:
-                        amoc = moc.sel(moc_z=z_bound, lat_aux_grid=lat_bound).max()
-
-                elif 'amoc' in list(self._obj.keys()):
-                    moc = self._obj.amoc
-                    moc.values[np.abs(moc.values) < 1e-6] = np.nan
-                    # amoc area
-                    if moc.z_t[-1] > 1e5:
-                        z_bound = moc.z_t[(moc.z_t > depth * 1e2) & (moc.z_t < 5e5)] #cm
-                    else:
-                        z_bound = moc.z_t[(moc.z_t > depth) & (moc.z_t < 5e3)] #m
-                    lat_bound = moc.lat[
-                                (moc.lat > lats[0]) & (moc.lat < lats[1])]
-                    if "time" in moc.dims:
-                        amoc = moc.sel(z_t=z_bound, lat=lat_bound).groupby('time').max()
-                    else:
-                        amoc = moc.sel(z_t=z_bound, lat=lat_bound).max()
-            except:
+            if 'MOC' in list(self._obj.keys()):
+                moc = self._obj.MOC.isel(transport_reg=1,moc_comp=0)
+                zname, latname = 'moc_z', 'lat_aux_grid'
+            elif 'amoc' in list(self._obj.keys()):
+                moc = self._obj.amoc
+                zname, latname = 'z_t', 'lat'
+            else:
                 raise ValueError('object has no MOC.')
+            moc = moc.where(np.abs(moc) >= 1e-6)
+
+            z = moc[zname]
+            lat = moc[latname]
+            # amoc area
+            if z[-1] > 1e5:
+                scale, zmax = 1e2, 5e5 #cm
+            else:
+                scale, zmax = 1, 5e3 #m
+            wins = [(depth, lats)] if windows is None else windows
+            mask = xr.concat([(z > d * scale) & (z < zmax) & (lat > l[0]) & (lat < l[1])
+                              for d, l in wins], dim='window')
+            # only read the box that covers all windows
+            box = {zname: mask.any(['window', latname]).values,
+                   latname: mask.any(['window', zname]).values}
+            field = moc.isel(box).where(mask.isel(box))
+            amoc = field.max([zname, latname])
+
+            if loc:
+                ind = field.fillna(-np.inf).argmax(dim=[zname, latname])
+                # index to coordinate value, works on lazy indices too
+                def at(c):
+                    values = field[c].values
+                    return xr.apply_ufunc(lambda i: values[i], ind[c], dask='parallelized',
+                                          output_dtypes=[values.dtype])
+                zloc = at(zname).where(amoc.notnull()).rename(zname)
+                latloc = at(latname).where(amoc.notnull()).rename(latname)
+
+            if windows is None:
+                amoc = amoc.isel(window=0, drop=True)
+                if loc:
+                    zloc = zloc.isel(window=0, drop=True)
+                    latloc = latloc.isel(window=0, drop=True)
+            else:
+                coords = dict(depth=('window', [w[0] for w in wins]),
+                              lat_min=('window', [w[1][0] for w in wins]),
+                              lat_max=('window', [w[1][1] for w in wins]))
+                amoc = amoc.assign_coords(**coords)
+                if loc:
+                    zloc = zloc.assign_coords(**coords)
+                    latloc = latloc.assign_coords(**coords)
+
+            if loc:
+                return amoc, zloc, latloc
             return amoc
         elif method == 'field':
-                moc = self._obj.MOC.isel(transport_reg=1,moc_comp=0).copy()
-                moc.values[np.abs(moc.values) < 1e-6] = np.nan
+                moc = self._obj.MOC.isel(transport_reg=1,moc_comp=0)
+                moc = moc.where(np.abs(moc) >= 1e-6)
                 moc = moc.rename({'moc_z':'z_t', 
                                   'lat_aux_grid':'lat'})
                 moc.name = 'amoc'
@@ -332,8 +375,7 @@ class POPDiagnosis(object):
         return self._obj
 
     def _selbasin(self, grid='gx1v6', region='Atlantic'):
-        basin = utl.ocean_region(grid)
-        return self._obj.where(basin[region])
+        return self._obj.where(utl.basin_mask(grid, region))
 
     def Atlantic(self, grid):
         return self._selbasin(grid, region='Atlantic')
@@ -357,56 +399,46 @@ class POPDiagnosis(object):
         return self._selbasin(grid, region='North_Atlantic')
 
     # compute ocean heat transport
-    def ocn_heat_transport(self, dlat=1, grid='g16'):
+    def ocn_heat_transport(self, dlat=1, grid='g16', method='Flux_adjusted', lat_bd=90, region=None):
+        '''
+        ocean heat transport from SHF, integrated from the south pole.
+        time is kept, see Utilities.ocn_heat_transport for region.
+        '''
+        flux = self._obj.SHF
+        if 'TLAT' in flux.coords.keys():
+            name = 'TLAT'
+        elif 'ULAT' in flux.coords.keys():
+            name = 'ULAT'
+        if region is not None:
+            flux = flux.where(utl.basin_mask(grid, region))
 
-        from scipy import integrate
-        # check time dimension
-        if 'time' in self._obj.dims:
-            flux = self._obj.SHF.mean('time')
-        else:
-            flux = self._obj.SHF
-
-        area = dict(g16=utl.tarea_g16, g35=utl.tarea_g35, g37=utl.tarea_g37)
-        flux_area = flux * area[grid] * 1e-4 # convert to m2
-        #
-        lat_bins = np.arange(-90,91,dlat)
-        lat = np.arange(-89.5,90,dlat)
-
-        if 'TLAT' in flux_area.coords.keys():
-            flux_lat = flux_area.groupby_bins('TLAT', lat_bins, labels = lat).sum()
-            latax = flux_lat.get_axis_num('TLAT_bins')
-        elif 'ULAT' in flux_area.coords.keys():
-            flux_lat = flux_area.groupby_bins('ULAT', lat_bins, labels = lat).sum()
-            latax = flux_lat.get_axis_num('ULAT_bins')
-        flux_lat.values = flux_lat - flux_lat.mean() # remove bias
-        flux_lat.values = np.nan_to_num(flux_lat.values)
-        integral = integrate.cumtrapz(flux_lat, x=None, initial=0., axis=latax)
-        OHT = flux_lat.copy()
-        OHT.values = integral *1e-15
-        return OHT
+        OHT = utl.heat_transport(flux, flux[name].values, utl.grid(grid).tarea, dlat=dlat,
+                                 method=method, lat_bd=lat_bd, from_north=False)
+        return OHT.rename({'lat': name + '_bins'})
 
 
     def mass_streamfun(self, dlat = 0.6, dlon = 0.1, OHT=False, region='global'):
         '''
         compute mass stream function in theta coordinates.
         reference to Ferrari and Ferreira 2011.
+        time dimension is kept if present.
         '''
         dz = utl.dz_g16 * 1e-2 #convert to m
-        angle = utl.angle_g16
+        angle = utl.angle_g16.copy()
         angle['ULONG'] = self._obj.ULONG # fix Ulong lost bug
 
         # meridional velocity
         VVEL = (self._obj.UVEL * np.sin(angle) + self._obj.VVEL * np.cos(angle)) * 1e-2 # convert to m
 
         # check region
-        if region=='Global':
+        if region in ['global', 'Global']:
             T = self._obj.TEMP
         elif region == 'Indo_Pacific':
-            VVEL = VVEL.utils.Indo_Pacific()
-            T = self._obj.TEMP.utils.Indo_Pacific()
+            VVEL = VVEL.utils.Indo_Pacific('gx1v6')
+            T = self._obj.TEMP.utils.Indo_Pacific('gx1v6')
         elif region == 'Arc_Atlantic':
-            VVEL = VVEL.utils.Arc_Atlantic()
-            T = self._obj.TEMP.utils.Arc_Atlantic()
+            VVEL = VVEL.utils.Arc_Atlantic('gx1v6')
+            T = self._obj.TEMP.utils.Arc_Atlantic('gx1v6')
         else:
             raise ValueError('region is not supported.')
 
@@ -421,48 +453,36 @@ class POPDiagnosis(object):
 
         dzdx = dz * dx
         work = V * dzdx
-#        work = work.fillna(0) # fill nan as 0
-        Tmin = np.floor(T.min())
-        Tmax = np.round(T.max())
+        Tmin = np.floor(float(T.min()))
+        Tmax = np.round(float(T.max()))
 
-        y = 0   # lat index
-        k = 0   # theta index
         dt = 0.5    # theta resolution
         temp_range = np.arange(Tmin,Tmax,dt)
-        Psi = np.zeros([len(work.lat),len(temp_range)])
-        for t in temp_range:
-            y = 0
-            for l in work.lat:
-                work1 = work.sel(lat=l).values
-                Tsel = T.sel(lat=l).values
-                if t <= np.nanmax(Tsel):
-                    Psi[y, k] = np.nansum(work1[(Tsel>=np.nanmin(Tsel)) & (Tsel<=t)])
-                else:
-                    Psi[y, k] = np.NaN
-                y += 1
-            k += 1
+        core_dims = ['z_t', 'lat', 'lon']
+        Psi = xr.apply_ufunc(utl.isothermal_streamfun, work, T,
+                             kwargs={'theta': temp_range},
+                             input_core_dims=[core_dims, core_dims],
+                             output_core_dims=[['lat', 'theta']],
+                             dask='parallelized', output_dtypes=[float],
+                             dask_gufunc_kwargs={'output_sizes': {'theta': len(temp_range)},
+                                                 'allow_rechunk': True})
+        Psi['theta'] = temp_range
 
         Psi = Psi * 1e-6 # convert to Sv
-        Psi[Psi==0] = np.NaN
-        Psi = -xr.DataArray(Psi, coords={'lat':work.lat, 'theta': temp_range},
-                                dims=['lat', 'theta'])
+        Psi = -Psi.where(Psi != 0)
 
         # smooth the stream function to remove noise
         Psi = Psi.rolling(lat=11, center=True).mean()
         Psi = Psi.rolling(theta=3, center=True).mean()
 
         if OHT:
-            from scipy import integrate
             Psim3 = Psi * 1e6 # to m3/s
             Psim3 = Psim3.fillna(0)
             Psim3HT = Psim3 * cc.rhosw * cc.cpsw * 1e-15 # to PW
-            theta_ax = Psim3HT.get_axis_num('theta')
-            integral = integrate.cumtrapz(Psim3HT, x=Psim3HT.theta, initial=0., axis=theta_ax)
-            OHT = xr.DataArray(integral, coords={'lat':Psi.lat, 'theta': temp_range},
-                                        dims=['lat', 'theta'])
-            return Psi.T, OHT.T
+            OHT = Psim3HT.cumulative_integrate('theta')
+            return Psi.transpose(..., 'theta', 'lat'), OHT.transpose(..., 'theta', 'lat')
         else:
-            return Psi.T
+            return Psi.transpose(..., 'theta', 'lat')
 
 
 @xr.register_dataarray_accessor('utils')
@@ -471,60 +491,44 @@ class Utilities(object):
         self._obj = xarray_obj
 
     # regrid pop variables
-    def regrid(self, dlon=1, dlat=1, grid_style='T'):
-        import pyresample
-
+    def regrid(self, dlon=1, dlat=1, grid_style='T', cache_dir=None):
+        '''
+        nearest neighbour regrid over the two rightmost (nlat, nlon) dims.
+        dask backed input stays lazy and keeps its chunks on the other dims.
+        '''
         dims = self._obj.dims
-        shape = self._obj.shape
-        temp = self._obj.values
-        temp = temp.reshape(-1,shape[-2],shape[-1])   # this requires time and z_t are at the first two axises
-        temp = temp.transpose(1,2,0)    #lat, lon rightmost
-
-        if grid_style is 'T':
-            lon_curv = self._obj.TLONG.values.copy()
-            lat_curv = self._obj.TLAT.values.copy()
-        elif grid_style is 'U':
-            lon_curv = self._obj.ULONG.values.copy()
-            lat_curv = self._obj.ULAT.values.copy()
-
-        # set lon to -180 to 180
-        lon_curv[lon_curv>180] = lon_curv[lon_curv>180] - 360
-
-        # targit grid
-        lon = np.arange(-180.,179.01,dlon)
-        lat = np.arange(-90.,89.999,dlat)
-        lon_lin, lat_lin = np.meshgrid(lon,lat)
-        lon_lin = pyresample.utils.wrap_longitudes(lon_lin)
-        #define two grid systems
-        orig_def = pyresample.geometry.SwathDefinition(lons=lon_curv, lats=lat_curv)
-        targ_def = pyresample.geometry.SwathDefinition(lons=lon_lin, lats=lat_lin)
-        rgd_data = pyresample.kd_tree.resample_nearest(orig_def, temp,
-        targ_def, radius_of_influence=1000000*np.sqrt(dlon**2), fill_value=np.nan)
-
-        rgd_data = rgd_data.transpose(2,0,1) #reshape back
-
-        if len(dims) > 3:
-            rgd_data = rgd_data.reshape(shape[0],shape[1],len(lat), len(lon))
-            ds =  xr.DataArray(rgd_data, coords=[self._obj[dims[0]], self._obj[dims[1]], lat,lon],
-                                dims=[dims[0], dims[1], 'lat', 'lon'])
-            ds.name = self._obj.name
-            # return ds
-
-        elif len(dims) > 2:
-            rgd_data = rgd_data.reshape(shape[0],len(lat), len(lon))
-            ds = xr.DataArray(rgd_data, coords=[self._obj[dims[0]], lat,lon],
-                                dims=[dims[0], 'lat', 'lon'])
-            ds.name = self._obj.name
-            # return ds
-        
-        elif len(dims) > 1:
-            rgd_data = rgd_data.squeeze()
-            ds = xr.DataArray(rgd_data, coords=[lat,lon], dims=['lat', 'lon'])
-            ds.name = self._obj.name
-            # return ds
+        if len(dims) < 2:
+            raise ValueError('Dataarray needs at least 2 dimensions.')
+
+        if grid_style == 'T':
+            lon_curv = self._obj.TLONG.values
+            lat_curv = self._obj.TLAT.values
+        elif grid_style == 'U':
+            lon_curv = self._obj.ULONG.values
+            lat_curv = self._obj.ULAT.values
         else:
-            raise ValueError('Dataarray has more than 4 dimensions.')
-
+            raise ValueError('grid_style should be T or U.')
+
+        # neighbour index is cached for each source grid and resolution
+        lon, lat, index = utl.regrid_index(lon_curv, lat_curv, dlon=dlon, dlat=dlat,
+                                           cache_dir=cache_dir)
+
+        # float32 fields stay float32, nan marks cells without a neighbour
+        dtype = np.result_type(self._obj.dtype, np.float32)
+
+        def _regrid(temp):
+            rgd_data = utl.gather(temp.reshape(temp.shape[:-2] + (-1,)), index)
+            return rgd_data.reshape(temp.shape[:-2] + (len(lat), len(lon))).astype(dtype, copy=False)
+
+        ds = xr.apply_ufunc(_regrid, self._obj,
+                            input_core_dims=[list(dims[-2:])],
+                            output_core_dims=[['lat', 'lon']],
+                            dask='parallelized', output_dtypes=[dtype],
+                            dask_gufunc_kwargs={'output_sizes': {'lat': len(lat), 'lon': len(lon)},
+                                                'allow_rechunk': True},
+                            keep_attrs=True)
+        ds = ds.assign_coords(lat=lat, lon=lon)
+        ds.name = self._obj.name
         return ds
 
     def globalmean(self):
@@ -546,30 +550,20 @@ class Utilities(object):
             return self._obj / utl.tarea_g16.sum()
 
     def gbvolmean(self, grid='g16'):
-
-        if grid == 'g16':
-            vol = utl.dz_g16 * utl.tarea_g16
-            total = self._obj * vol.values.reshape([-1,vol.shape])
-
-        elif grid == 'g35':
-            vol = utl.dz_g35 * utl.tarea_g35
-            total = self._obj * vol
-        elif grid == 'g37':
-            vol = utl.dz_g37 * utl.tarea_g37
-            total = self._obj * vol
-        else:
-            raise ValueError('Grid is not suppported.')
-
-        if 'time' in self._obj.dims:
-            output = total.groupby('time').sum() / vol.sum()
-        else:
-            output = total.sum() / vol.sum()
-
+        '''
+        volume weighted mean over (z_t, nlat, nlon), other dims such as time
+        are kept. dask backed fields are reduced chunk by chunk.
+        '''
+        vol = utl.volume_weights(grid)
+        output = self._obj.weighted(vol).mean(['z_t', 'nlat', 'nlon'])
         output.name = self._obj.name
         return output
 
-    def zonalmean(self, res=1):
-        
+    def zonalmean(self, res=1, area=None):
+        '''
+        zonal mean, pop fields are binned on TLAT (or ULAT) with a cached
+        sparse operator. area: optional weights, e.g. utl.grid('gx1v6').tarea
+        '''
         coords = list(self._obj.coords)
         
         if 'lon' in coords:
@@ -585,16 +579,15 @@ class Utilities(object):
             lat_center = np.arange(-89.5, 90, 1)
             lat_bins = np.arange(-90, 91, 1)
         
-        try:
-            zonal = self._obj.groupby_bins('TLAT', lat_bins, labels=lat_center).mean('stacked_nlat_nlon') 
-            zonal = zonal.rename({'TLAT_bins':'lat'})
-        except:
-            zonal = self._obj.groupby_bins('ULAT', lat_bins, labels=lat_center).mean('stacked_nlat_nlon')  
-            zonal = zonal.rename({'ULAT_bins':'lat'})
-    
-        zonal.name = self._obj.name
-        return zonal     
-                
+        if 'TLAT' in coords:
+            lat = self._obj.TLAT
+        else:
+            lat = self._obj.ULAT
+
+        zonal = utl.zonal_reduce(self._obj, lat.values, lat_bins, lat_center,
+                                 how='mean', weights=area, dims=lat.dims)
+        return zonal
+
     def meridionalmean(self):
 
         lat_rad = np.deg2rad(self._obj.lat)
@@ -630,12 +623,69 @@ class Utilities(object):
         
         return sellect
 
+    def sellocs(self, locs=None, grid_method='regular', weights=None):
+        '''
+        mean over many sites in one pass, returns (site, ...) data.
+        locs: names in utl.locations, or a dict of name: [lat0, lat1, lon0, lon1]
+              boxes or (lat, lon) points. all named locations by default.
+        weights: optional cell weights, e.g. TAREA or cos(lat)
+        '''
+        if locs is None:
+            locs = list(utl.locations.keys())
+        if not isinstance(locs, dict):
+            locs = dict((l, utl.locations[l]) for l in locs)
+        names = list(locs.keys())
+
+        if grid_method == 'regular':
+            lat, lon = xr.broadcast(self._obj.lat, self._obj.lon)
+        elif grid_method == 'T':
+            lat, lon = self._obj.TLAT, self._obj.TLONG
+        elif grid_method == 'U':
+            lat, lon = self._obj.ULAT, self._obj.ULONG
+        else:
+            raise ValueError('grid_method should be regular, T or U.')
+
+        op = utl.site_operator(lat.values, lon.values, [locs[n] for n in names], weights=weights)
+        sites = utl.sparse_reduce(self._obj, op, lat.dims, 'site', names, how='mean')
+        return sites.transpose('site', ...)
+
+    def compare_proxies(self, names=None, sites=None, ages=None, bins=None,
+                        grid_method='regular', weights=None, quantity=None):
+        '''
+        compare with the bundled proxy records (utl.proxies) in one pass.
+        names: proxies, by default the located records of quantity
+        quantity: 'd18O', 'dD' or 'sea_level', guessed from the variable name
+                  (d18op -> d18O, dDp -> dD) when not given
+        sites: dict of name: [lat0, lat1, lon0, lon1] or (lat, lon), overrides
+               or completes the catalog locations (hzz1/hzz2 have none)
+        ages: model time in ka (negative before present), time by default
+        bins: age bin edges, compare bin means instead of the proxy ages
+        returns model and record (proxy, age), r, rmse and n per proxy
+        '''
+        if grid_method == 'regular':
+            lat, lon = xr.broadcast(self._obj.lat, self._obj.lon)
+        elif grid_method == 'T':
+            lat, lon = self._obj.TLAT, self._obj.TLONG
+        elif grid_method == 'U':
+            lat, lon = self._obj.ULAT, self._obj.ULONG
+        else:
+            raise ValueError('grid_method should be regular, T or U.')
+
+        return utl.proxies.compare(self._obj, lat, lon, names=names, sites=sites,
+                                   ages=ages, bins=bins, weights=weights, quantity=quantity)
+
     def _selbasin(self, grid='gx1v6', region='Atlantic'):
-        basin = utl.ocean_region(grid)
-        ds = self._obj.where(basin[region])
+        ds = self._obj.where(utl.basin_mask(grid, region))
         ds.name = self._obj.name
         return ds
 
+    def basin_reduce(self, grid='gx1v6', regions=None, how='mean', weights=None):
+        '''
+        sum, mean or weighted mean (wmean, TAREA by default) in many basins at once
+        '''
+        return utl.basin_reduce(self._obj, grid=grid, regions=regions, how=how,
+                                weights=weights)
+
     def Atlantic(self, grid):
         return self._selbasin(grid, region='Atlantic')
 
@@ -659,86 +709,72 @@ class Utilities(object):
 
 
     # compute ocean heat transport
-    def ocn_heat_transport(self, dlat=1, grid='g16', method='Flux_adjusted', lat_bd=90):
-
-        from scipy import integrate
-
+    def ocn_heat_transport(self, dlat=1, grid='g16', method='Flux_adjusted', lat_bd=90, region=None):
+        '''
+        ocean heat transport from a surface heat flux, integrated from the north pole.
+        time is kept. region: basin name or list of names (see utl.BASINS),
+        method and lat_bd can be dicts keyed by basin. a list gives a 'basin' dim.
+        '''
         flux = self._obj
-        area = dict(g16=utl.tarea_g16, g35=utl.tarea_g35, g37=utl.tarea_g37)
-        flux_area = flux.copy()
-        flux_area.values = flux * area[grid] * 1e-4 # convert to m2
-
-        lat_bins = np.arange(-90,91,dlat)
-        lat = np.arange(-89.5,90,dlat)
-
-
-        if 'TLAT' in flux_area.coords.keys():
-            flux_lat = flux_area.groupby_bins('TLAT', lat_bins, labels = lat).sum('stacked_nlat_nlon')
-            latax = flux_lat.get_axis_num('TLAT_bins')
-        elif 'ULAT' in flux_area.coords.keys():
-            flux_area = flux_area.rename({"ULAT":"TLAT"})
-            flux_lat = flux_area.groupby_bins('TLAT', lat_bins, labels = lat).sum('stacked_nlat_nlon')
-            latax = flux_lat.get_axis_num('TLAT_bins')
-
-        TLAT_bins = flux_lat.TLAT_bins
-        if method == "Flux_adjusted":
-
-            flux_lat = flux_lat.where(TLAT_bins < lat_bd) # north bound
-            flat_ave = flux_lat.mean('TLAT_bins')
-            flux_lat.values = flux_lat - flat_ave # remove bias
-            flux_lat = flux_lat.fillna(0)
-            print("The ocean heat trasnport is computed by Flux adjustment.")
-
-        elif method == "Flux":
-            flux_lat = flux_lat.fillna(0)
-            print("The ocean heat trasnport is computed by original flux.")
-        else:
-            raise ValueError("method is not suppoprted.")
-
-        flux_lat.values = -np.flip(flux_lat.values, latax)   # integrate from north pole
-        integral = integrate.cumtrapz(flux_lat, x=None, initial=0., axis=latax)
-        OHT = flux_lat.copy()
-        OHT["TLAT_bins"] = np.flip(flux_lat.TLAT_bins.values, 0)
-        OHT.values = integral *1e-15
-
-        return OHT
-
-
-    def hybrid_to_pressure(self, model= 'CESM1', stride='m', P0=100000.):
+        if 'TLAT' in flux.coords.keys():
+            lat = flux.TLAT.values
+        elif 'ULAT' in flux.coords.keys():
+            lat = flux.ULAT.values
+        area = utl.grid(grid).tarea
+
+        def _oht(flux, method, lat_bd):
+            if method == "Flux_adjusted":
+                print("The ocean heat trasnport is computed by Flux adjustment.")
+            elif method == "Flux":
+                print("The ocean heat trasnport is computed by original flux.")
+            OHT = utl.heat_transport(flux, lat, area, dlat=dlat, method=method,
+                                     lat_bd=lat_bd, from_north=True)
+            return OHT.rename({'lat': 'TLAT_bins'})
+
+        if region is None:
+            return _oht(flux, method, lat_bd)
+
+        regions = [region] if isinstance(region, str) else list(region)
+        pick = lambda v, r: v[r] if isinstance(v, dict) else v
+        OHT = [_oht(flux.where(utl.basin_mask(grid, r)), pick(method, r), pick(lat_bd, r))
+               for r in regions]
+        if isinstance(region, str):
+            return OHT[0]
+        return xr.concat(OHT, dim='basin').assign_coords(basin=regions)
+
+
+    def hybrid_to_pressure(self, model= 'CESM1', stride='m', P0=100000., res='T42', source=None):
         """
         Brought from darpy:https://github.com/darothen/darpy/blob/master/darpy/analysis.py
         Convert hybrid vertical coordinates to pressure coordinates
-        corresponding to model sigma levels.
+        corresponding to model sigma levels. The pressure is a lazy
+        expression when PS is dask backed and is computed chunk by chunk.
         Parameters
         ----------
-        data : xarray.Dataset
-            The dataset to inspect for computing vertical levels
+        data : xarray.DataArray
+            Surface pressure (PS) in Pa
         stride : str, either 'm' or 'i'
             Indicate if the field is on the model level interfaces or
             middles for referencing the correct hybrid scale coefficients
         P0 : float, default = 1000000.
             Default reference pressure in Pa, used as a fallback.
+        res : str, default = 'T42'
+            Model resolution, coefficients are bundled for T42
+        source : xarray.Dataset, optional
+            History file with hyam/hybm (hyai/hybi), the only way to use
+            coefficients of resolutions other than T42.
         """
 
+        PS = self._obj  # Surface pressure field
+
         # A, B coefficients
-        if model == 'CESM1':
-            a = dict(i42=utl.hyai_cesm1_t42, m42=utl.hyam_cesm1_t42)
-            b = dict(i42=utl.hybi_cesm1_t42, m42=utl.hybm_cesm1_t42)
-        elif model == 'CCSM4' or model == 'CCSM3':
-            a = dict(i42=utl.hyai_t42, m42=utl.hyam_t42)
-            b = dict(i42=utl.hybi_t42, m42=utl.hybm_t42)
-
-        if stride == 'm':
-            a = a['m42']
-            b = b['m42']
-        else:
-            a = a['i42']
-            b = b['i42']
+        a, b = utl.hybrid_coefs(model=model, res=res, stride=stride, source=source)
 
         P0_ref = P0
-        PS = self._obj  # Surface pressure field
 
         pres_sigma = a*P0_ref + b*PS
+        pres_sigma.name = 'pres'
+        pres_sigma.attrs['units'] = 'Pa'
 
         return pres_sigma
 
@@ -756,123 +792,66 @@ class Utilities(object):
         """
         browwed from darpy
         tested with NCL code.
-        Interpolate all columns simultaneously by iterating over
-        vertical dimension of original dataset, following methodology
-        used in UV-CDAT.
+        Interpolate all columns simultaneously, the bracketing levels of every
+        target level are found along 'lev' in one pass (see utils.interp_columns).
+        Dask backed data is interpolated lazily chunk by chunk.
         Parameters
         ----------
         data : xarray.DataArray
             The data (array) of values to be interpolated
         coord_vals : xarray.DataArray
-            An array containing a 3D field to be used as an alternative vertical coordinate
+            An array containing a 3D field to be used as an alternative vertical coordinate,
+            increasing from index 0 to n along 'lev' as CESM pressure does
         new_coord_vals : iterable
             New coordinate values to inerpolate to
-        reverse_coord : logical, default=False
-            Indicates that the coord *increases* from index 0 to n; should be "True" when
-            interpolating pressure fields in CESM
         interpolation : str
             "log" or "lin", indicating the interpolation method
         Returns
         -------
-        list of xarray.DataArrays of length equivalent to that of new_coord_vals, with the
-        field interpolated to each value in new_coord_vals
+        xarray.DataArray with 'lev' replaced by new_coord_vals, nan where a target
+        level is not bracketed by the column
         """
 
-        # Shuffle dims so that 'lev' is first for simplicity
+        if interpolation not in ['lin', 'log']:
+            raise ValueError("Don't know how to interpolate '{}'".format(interpolation))
+
         data = self._obj
         data_orig_dim = list(data.dims)
-        data = self.shuffle_dim(data)
-
-        coords_out = {'lev': new_coord_vals}
-        for c in data.dims:
-            if c == 'lev':
-                continue
-            coords_out[c] = data.coords[c]
-
-
-        # Find the 'lev' axis for interpolating
-        orig_shape = data.shape
-        axis = data.get_axis_num('lev')
-        n_lev = orig_shape[axis]
-
-        n_interp = len(new_coord_vals)  # Number of interpolant levels
-
-        data_interp_shape = [n_interp, ] + list(orig_shape[1:])
-        data_new = np.zeros(data_interp_shape)
-
-        # Shape of array at any given level
-        flat_shape = coord_vals.isel(lev=0).shape
-
-        # Loop over the interpolant levels
-        for ilev in range(n_interp):
-
-            lev = new_coord_vals[ilev]
-
-            P_abv = np.ones(flat_shape)
-            # Array on level above, below
-            A_abv, A_bel = -1.*P_abv, -1.*P_abv
-            # Coordinate on level above, below
-            P_abv, P_bel = -1.*P_abv, -1.*P_abv
-
-            # Mask area where coordinate == levels
-            P_eq = np.ma.masked_equal(P_abv, -1)
-
-            # Loop from the second sigma level to the last one
-            for i in range(1, n_lev):
-
-                a = np.ma.greater_equal(coord_vals.isel(lev=i), lev)
-                b = np.ma.less_equal(coord_vals.isel(lev=i - 1), lev)
-
-
-                # Now, if the interpolant level is between the two
-                # coordinate levels, then we can use these two levels for the
-                # interpolation.
-                a = (a & b)
-
-                # Coordinate on level above, below
-                P_abv = np.where(a, coord_vals[i], P_abv)
-                P_bel = np.where(a, coord_vals[i - 1], P_bel)
-                # Array on level above, below
-                A_abv = np.where(a, data[i], A_abv)
-                A_bel = np.where(a, data[i-1], A_bel)
-
-                P_eq = np.where(coord_vals[i] == lev, data[i], P_eq)
-
-            # If no data below, set to missing value; if there is, set to
-            # (interpolating) level
-            P_val = np.ma.masked_where((P_bel == -1), np.ones_like(P_bel)*lev)
-
-            # Calculate interpolation
-            if interpolation == 'log':
-                tl = np.log(P_val/P_bel)/np.log(P_abv/P_bel)*(A_abv - A_bel) + A_bel
-            elif interpolation == 'lin':
-                tl = A_bel + (P_val-P_bel)*(A_abv - A_bel)/(P_abv - P_bel)
-            else:
-                raise ValueError("Don't know how to interpolate '{}'".format(interpolation))
-            tl.fill_value = np.nan
-
-            # Copy into result array, masking where values are missing
-            # because of bad interpolation (out of bounds, etc.)
-            tl[tl.mask] = np.nan
-            data_new[ilev] = tl
-
-        dataout = xr.DataArray(data_new, coords=coords_out, dims=data.dims)
+        new_coord_vals = np.asarray(new_coord_vals, dtype=float)
+
+        dataout = xr.apply_ufunc(utl.interp_columns, data, coord_vals,
+                                 kwargs={'levels': new_coord_vals,
+                                         'interpolation': interpolation},
+                                 input_core_dims=[['lev'], ['lev']],
+                                 output_core_dims=[['lev']],
+                                 exclude_dims={'lev'},
+                                 dask='parallelized', output_dtypes=[float],
+                                 dask_gufunc_kwargs={'output_sizes': {'lev': len(new_coord_vals)},
+                                                     'allow_rechunk': True})
+        dataout['lev'] = new_coord_vals
         dataout = dataout.transpose(*data_orig_dim)
+        dataout.name = data.name
         return dataout
 
 
-    def mass_streamfun(self):
-
-        from scipy import integrate
+    def mass_streamfun(self, pres=None):
+        '''
+        atmosphere overturning streamfunction of meridional wind V on 'lev'.
+        lev is in hPa unless pres, the pressure (Pa) of every level (e.g.
+        from hybrid_to_pressure), is given. The integral is a cumulative
+        trapezoid along 'lev', computed blockwise for dask input.
+        '''
 
         data = self._obj
 #        lonlen = len(data.lon)
         if 'lon' in data.dims:
             data = data.fillna(0).mean('lon')
-        levax = data.get_axis_num('lev')
-        stream = integrate.cumtrapz(data * np.cos(np.deg2rad(data.lat)), x=data.lev * 1e2, initial=0., axis=levax)
+        if pres is None:
+            pres = data.lev * 1e2
+        elif 'lon' in pres.dims:
+            pres = pres.mean('lon')
+        stream = utl.cumtrapz_along(data * np.cos(np.deg2rad(data.lat)), pres, 'lev')
         stream = stream * 2 * np.pi  / cc.g * cc.rearth * 1e-9
-        stream = xr.DataArray(stream, coords=data.coords, dims=data.dims)
         stream = stream.rename('ovt')
         stream.attrs['long name'] = 'atmosphere overturning circulation'
         stream.attrs['unit'] = 'Sv (1e9 kg/s)'
@@ -957,6 +936,18 @@ class Utilities(object):
         ax.set_ylabel('')
         return ax
 
+    def quickmap_frames(self, outdir, dim='time', processes=None, video=None,
+                        central_longitude=180, cmap='NCV_blu_red', **kwargs):
+        '''
+        quickmap of every step along dim, written as PNG files (and a video)
+        by a pool of processes, see plots.frames.render_frames
+        '''
+        from ..plots import frames
+
+        return frames.render_frames(self._obj, outdir, dim=dim, processes=processes,
+                                    video=video, central_longitude=central_longitude,
+                                    cmap=cmap, **kwargs)
+
 
 
 @xr.register_dataarray_accessor('stat')
@@ -980,6 +971,22 @@ class Utilities(object):
         return nm  
 
 
+    def stats_with(self, dsarrayy, dim='time'):
+        '''
+        Correlation (r), regression (slope), covariance (cov), two sided
+        p-value of r and effective sample size (neff) against dsarrayy in
+        one pass over the data. neff accounts for the lag-1 autocorrelation
+        of both series. Dask input stays lazy and runs in parallel over
+        chunks.
+        '''
+        dsarrayx = self._obj
+        ds = utl.comoment_stats(dsarrayx, dsarrayy, dim=dim)
+        try:
+            ds.attrs['Description'] = 'Statistics of ' + dsarrayx.name + ' against ' + dsarrayy.name + '.'
+        except:
+            pass
+        return ds
+
     def corr_with(self, dsarrayy, dim='time'):
         
         '''
@@ -987,14 +994,7 @@ class Utilities(object):
         '''
         dsarrayx = self._obj
 
-        x = dsarrayx - dsarrayx.mean(dim=dim)
-        y = dsarrayy - dsarrayy.mean(dim=dim)
-        xy = x * y
-        xy = xy.mean(dim=dim)
-
-        xx = dsarrayx.std(dim=dim)
-        yy = dsarrayy.std(dim=dim)
-        r = xy / xx / yy
+        r = utl.comoment_stats(dsarrayx, dsarrayy, dim=dim, stats=['r'])['r']
         r.name = 'r'
         r.attrs['units'] = 'unitless'
         try:
@@ -1006,20 +1006,13 @@ class Utilities(object):
     def regress_with(self, dsarrayy, dim='time'):
         
         '''
-        Pearson correlation
+        Regression coefficients
         '''
         dsarrayx = self._obj
 
-        x = dsarrayx - dsarrayx.mean(dim=dim)
-        y = dsarrayy - dsarrayy.mean(dim=dim)
-        xy = x * y
-        xy = xy.mean(dim=dim)
-
-        # xx = dsarrayx.std(dim=dim)
-        yy = dsarrayy.std(dim=dim)
-        r = xy / yy ** 2
+        r = utl.comoment_stats(dsarrayx, dsarrayy, dim=dim, stats=['slope'])['slope']
         r.name = 'r'
-        # r.attrs['units'] = 'unitless'
+        r.attrs = {}
         try:
             r.attrs['Description'] = 'Regression Coefficients of ' + dsarrayx.name + ' on ' + dsarrayy.name + '.'
         except:
@@ -1027,14 +1020,19 @@ class Utilities(object):
         return r
 
     
-    def butter_filter(self, cutoff, fs, btype, order=5): 
+    def butter_filter(self, cutoff, fs, btype, order=5, dim='time', workers=None): 
         '''
-        Butterworth filter, only applied on 1d array
+        Butterworth filter along dim of an N-D array, applied forward and
+        backward with second-order sections.
         fs: sample rate
+        workers: number of threads for in memory arrays; dask arrays are
+                 filtered chunk by chunk, with dim in a single chunk
         '''
         from scipy import signal
         
         dsarray = self._obj
+        if dim not in dsarray.dims and dsarray.ndim == 1:
+            dim = dsarray.dims[0]
 
         nyq = 0.5 * fs
         # check if bandpass 
@@ -1043,11 +1041,26 @@ class Utilities(object):
         else:
             normal_cutoff = cutoff / nyq
 
-        b, a = signal.butter(order, normal_cutoff, btype=btype, analog=False)
-        y = signal.filtfilt(b, a, dsarray.values)
-
-        newds = xr.ones_like(dsarray)
-        newds.values = y
+        sos = signal.butter(order, normal_cutoff, btype=btype, analog=False, output='sos')
+
+        def _filter(data):
+            if not workers or data.ndim < 2:
+                return signal.sosfiltfilt(sos, data, axis=-1)
+            from concurrent.futures import ThreadPoolExecutor
+            flat = data.reshape(-1, data.shape[-1])
+            blocks = np.array_split(np.arange(flat.shape[0]), workers)
+            with ThreadPoolExecutor(workers) as pool:
+                parts = pool.map(lambda ind: signal.sosfiltfilt(sos, flat[ind], axis=-1), blocks)
+            return np.concatenate(list(parts)).reshape(data.shape)
+
+        if dsarray.chunks is not None:
+            dsarray = dsarray.chunk({dim: -1})
+        newds = xr.apply_ufunc(_filter, dsarray,
+                               input_core_dims=[[dim]], output_core_dims=[[dim]],
+                               dask='parallelized', output_dtypes=[float])
+        newds = newds.transpose(*dsarray.dims)
+        newds.name = dsarray.name
+        newds.attrs = dict(dsarray.attrs)
         newds.attrs['Description'] = btype + ' Pass Butterworth filter at cutoff: ' + str(cutoff) 
 
         return newds
@@ -1098,4 +1111,16 @@ class Utilities(object):
         ax.yaxis.set_major_formatter(lat_formatter)
         ax.set_xlabel('')
         ax.set_ylabel('')
-        return ax
\ No newline at end of file
+        return ax
+
+    def quickmap_frames(self, outdir, dim='time', processes=None, video=None,
+                        central_longitude=180, cmap='NCV_blu_red', **kwargs):
+        '''
+        quickmap of every step along dim, written as PNG files (and a video)
+        by a pool of processes, see plots.frames.render_frames
+        '''
+        from ..plots import frames
+
+        return frames.render_frames(self._obj, outdir, dim=dim, processes=processes,
+                                    video=video, central_longitude=central_longitude,
+                                    cmap=cmap, **kwargs)
@@ -7,17 +7,69 @@ import os
 
 
 COLOR_PATH = os.path.join(os.path.dirname(__file__))
-with open(COLOR_PATH + '/colormap.json', 'r') as f:
-    colors = json.load(f)
+
+# colormap.json is parsed on the first cmap() call, every (name, bins)
+# colormap is built once and copied for each caller
+_colors = None
+_cmaps = {}
+
+def _load_colors():
+    global _colors
+    if _colors is None:
+        with open(COLOR_PATH + '/colormap.json', 'r') as f:
+            _colors = json.load(f)
+    return _colors
+
+def __getattr__(name):
+    # keep colormap.colors working without parsing the json at import
+    if name == 'colors':
+        return _load_colors()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def names():
+    return list(_load_colors().keys())
 
 def cmap(name, bins=None):
-    data = np.array(colors[name])
+    # callers get a copy, set_bad/set_under on one must not leak into others
+    key = (name, bins if isinstance(bins, int) else None)
+    if key in _cmaps:
+        return _cmaps[key].copy()
+
+    data = np.array(_load_colors()[name])
     data = data / np.max(data)
     cmap = ListedColormap(data, name=name)
 
     if isinstance(bins, int):
-        cmap = cmap._resample(bins)
-    return cmap
+        cmap = cmap.resampled(bins) if hasattr(cmap, 'resampled') else cmap._resample(bins)
+    _cmaps[key] = cmap
+    return cmap.copy()
+
+def register(names=None, bins=None):
+    '''
+    register colormaps with matplotlib once, so they can be used by name
+    (e.g. cmap='NCV_blu_red', or 'NCV_blu_red_12' with bins=12) and are
+    inherited by forked workers. all colormaps by default.
+    '''
+    import matplotlib
+
+    if names is None:
+        names = list(_load_colors().keys())
+    elif isinstance(names, str):
+        names = [names]
+    registered = []
+    for name in names:
+        cm = cmap(name, bins)
+        mpl_name = name if not isinstance(bins, int) else '{}_{}'.format(name, bins)
+        if hasattr(matplotlib, 'colormaps'):
+            if mpl_name not in matplotlib.colormaps:
+                matplotlib.colormaps.register(cm, name=mpl_name)
+        else:
+            try:
+                plt.get_cmap(mpl_name)
+            except ValueError:
+                plt.register_cmap(name=mpl_name, cmap=cm)
+        registered.append(mpl_name)
+    return registered
 
 def subplots(nrow=2, ncol=2, figsize=None, ind=None, **kwarg):
     import cartopy.crs as ccrs
@@ -0,0 +1,156 @@
+import os
+import re
+import string
+import numpy as np
+
+from . import colormap as clrmp
+
+
+def _ticks(central_longitude):
+    if central_longitude == 0:
+        return [-180, -120, -60, 0, 60, 120, 180]
+    return [0, 60, 120, 180, 240, 300, 359.99]
+
+
+def _horizontal_dims(dsarray, dim):
+    '''
+    the latitude and longitude dims of dsarray, found by name
+    '''
+    found = []
+    for key in ['lat', 'lon']:
+        names = [d for d in dsarray.dims if d != dim and key in d.lower()]
+        if len(names) != 1:
+            raise ValueError('cannot tell the {} dim of {}.'.format(key, dsarray.dims))
+        found.append(names[0])
+    return found
+
+
+def _ffmpeg_pattern(fname):
+    '''
+    the ffmpeg image sequence pattern of a frame file name, e.g.
+    frame_{:05d}.png -> frame_%05d.png
+    '''
+    parts = list(string.Formatter().parse(fname))
+    fields = [p for p in parts if p[1] is not None]
+    if (len(fields) != 1 or fields[0][1] not in ('', '0') or fields[0][3] is not None
+            or not re.match(r'^(0\d+)?d?$', fields[0][2])):
+        raise ValueError('fname should have a single integer field such as {{:05d}} '
+                         'to be joined into a video, got {}.'.format(fname))
+    pattern = ''
+    for text, field, spec, _ in parts:
+        pattern += text.replace('%', '%%')
+        if field is not None:
+            pattern += '%' + spec.rstrip('d') + 'd'
+    return pattern
+
+
+def _setup(lon, lat, first, central_longitude=180, cmap='NCV_blu_red',
+           vmin=None, vmax=None, figsize=(8.5, 3.8), label='', title=''):
+    '''
+    figure, axes, coastlines, ticks and colorbar of a quickmap, drawn once.
+    returns the figure, the mesh whose data is swapped per frame and the title.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
+
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_subplot(111, projection=ccrs.PlateCarree(central_longitude=central_longitude))
+    mesh = ax.pcolormesh(lon, lat, np.ma.masked_invalid(first), cmap=clrmp.cmap(cmap),
+                         vmin=vmin, vmax=vmax, transform=ccrs.PlateCarree(), shading='auto')
+    cbar = fig.colorbar(mesh, ax=ax, orientation='vertical', fraction=0.09, aspect=15)
+    cbar.set_label(label)
+
+    ax.set_global()
+    ax.coastlines(linewidth=0.6)
+    ax.set_xticks(_ticks(central_longitude), crs=ccrs.PlateCarree())
+    ax.set_yticks([-90, -60, -30, 0, 30, 60, 90], crs=ccrs.PlateCarree())
+    ax.xaxis.set_major_formatter(LongitudeFormatter(zero_direction_label=True,
+                                                    number_format='.0f'))
+    ax.yaxis.set_major_formatter(LatitudeFormatter())
+    ax.set_xlabel('')
+    ax.set_ylabel('')
+    title = ax.set_title(title)
+    return fig, mesh, title
+
+
+def _render(task):
+    '''
+    worker: draw the map once and save every frame of a block of data
+    '''
+    import matplotlib.pyplot as plt
+
+    lon, lat, data, titles, paths, options = task
+    options = dict(options)
+    dpi = options.pop('dpi', 100)
+    fig, mesh, title = _setup(lon, lat, data[0], **options)
+    for values, text, path in zip(data, titles, paths):
+        mesh.set_array(np.ma.masked_invalid(values))
+        title.set_text(text)
+        fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return paths
+
+
+def render_frames(dsarray, outdir, dim='time', processes=None, frames_per_task=50,
+                  fname='frame_{:05d}.png', video=None, fps=24, central_longitude=180,
+                  cmap='NCV_blu_red', vmin=None, vmax=None, dpi=100, figsize=(8.5, 3.8)):
+    '''
+    Render quickmaps of every step along dim of a (dim, lat, lon) array as
+    PNG files in outdir. The map is set up once per block of frames_per_task
+    frames and only the data of the mesh changes between frames. Blocks are
+    loaded one at a time and spread over a pool of processes, at most two
+    blocks per process are in flight. vmin/vmax default to the range of the
+    whole array so frames share one color scale. If video is a file name,
+    the frames are joined with ffmpeg at fps. Returns the PNG paths.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    if dsarray.ndim != 3 or dim not in dsarray.dims:
+        raise ValueError('dsarray should be 3-D with {} and two horizontal dims.'.format(dim))
+    lat, lon = _horizontal_dims(dsarray, dim)
+    dsarray = dsarray.transpose(dim, lat, lon)
+    if video is not None:
+        pattern = os.path.join(outdir, _ffmpeg_pattern(fname))
+    if vmin is None:
+        vmin = float(dsarray.min())
+    if vmax is None:
+        vmax = float(dsarray.max())
+
+    os.makedirs(outdir, exist_ok=True)
+    label = dsarray.attrs.get('units', '')
+    if dsarray.name is not None:
+        label = '{} [{}]'.format(dsarray.name, label) if label else dsarray.name
+    options = dict(central_longitude=central_longitude, cmap=cmap, vmin=vmin, vmax=vmax,
+                   figsize=figsize, label=label, dpi=dpi)
+    lonv, latv = dsarray[lon].values, dsarray[lat].values
+    steps = dsarray[dim].values if dim in dsarray.coords else np.arange(dsarray.sizes[dim])
+
+    def tasks():
+        for start in range(0, dsarray.sizes[dim], frames_per_task):
+            ind = range(start, min(start + frames_per_task, dsarray.sizes[dim]))
+            data = np.asarray(dsarray.isel({dim: slice(ind.start, ind.stop)}).values, dtype=float)
+            titles = ['{} = {}'.format(dim, steps[i]) for i in ind]
+            paths = [os.path.join(outdir, fname.format(i)) for i in ind]
+            yield lonv, latv, data, titles, paths, options
+
+    processes = processes or os.cpu_count() or 1
+    paths = []
+    with ProcessPoolExecutor(processes) as pool:
+        pending = []
+        for task in tasks():
+            pending.append(pool.submit(_render, task))
+            if len(pending) >= 2 * processes:
+                paths.extend(pending.pop(0).result())
+        for future in pending:
+            paths.extend(future.result())
+
+    if video is not None:
+        import subprocess
+        import matplotlib
+        ffmpeg = matplotlib.rcParams.get('animation.ffmpeg_path', 'ffmpeg')
+        subprocess.check_call([ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps),
+                               '-i', pattern, '-pix_fmt', 'yuv420p', video])
+    return paths